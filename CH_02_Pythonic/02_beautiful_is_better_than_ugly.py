@@ -1,3 +1,9 @@
+# All of the versions below in a single function that accepts any
+# iterable and filters NumPy arrays with a mask, see filter_modulo.py for
+# a benchmark
+import filter_modulo as final
+
+
 def filter_modulo(items, modulo):
     output_items = []
     for i in range(len(items)):
@@ -28,4 +34,7 @@ def filter_modulo(items, modulo):
             yield item
 
 
-list(filter_modulo(range(10), 3))
\ No newline at end of file
+list(filter_modulo(range(10), 3))
+
+
+list(final.filter_modulo(range(10), 3))
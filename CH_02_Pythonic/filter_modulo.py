@@ -0,0 +1,103 @@
+'''
+The `filter_modulo` variants from 02_beautiful_is_better_than_ugly.py
+side by side, and a single `filter_modulo` to use instead.
+
+The list versions index with `range(len(items))` so they only work on
+sequences and always build the complete result. `filter_modulo` accepts
+any iterable and returns a lazy iterator, except for NumPy arrays and
+`array.array` instances where a boolean mask filters the whole array at
+C speed (which needs NumPy):
+
+    >>> list(filter_modulo(range(10), 3))
+    [1, 2, 4, 5, 7, 8]
+    >>> filter_modulo(numpy.arange(10), 3)
+    array([1, 2, 4, 5, 7, 8])
+
+Run this file for a benchmark table of all variants.
+'''
+import array
+import timeit
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def filter_modulo_loop(items, modulo):
+    output_items = []
+    for i in range(len(items)):
+        if items[i] % modulo:
+            output_items.append(items[i])
+    return output_items
+
+
+def filter_modulo_dense(i, m): return [i[j] for j in range(len(i)) if i[j] % m]
+
+
+def filter_modulo_comprehension(items, modulo):
+    return [items[i] for i in range(len(items)) if items[i] % modulo]
+
+
+def filter_modulo_generator(items, modulo):
+    for item in items:
+        if item % modulo:
+            yield item
+
+
+def filter_modulo_mask(items, modulo):
+    '''Filter a NumPy array or `array.array` with a boolean mask, the
+    result has the same type as the input'''
+    if isinstance(items, array.array):
+        values = numpy.frombuffer(items, dtype=items.typecode)
+        return array.array(items.typecode, values[values % modulo != 0])
+    return items[items % modulo != 0]
+
+
+def filter_modulo(items, modulo):
+    '''Return the items not divisible by `modulo`. Arrays are filtered
+    at once, for anything else a lazy iterator is returned.'''
+    if numpy is not None:
+        if isinstance(items, numpy.ndarray) or (
+                isinstance(items, array.array) and items.typecode != 'u'):
+            return filter_modulo_mask(items, modulo)
+    return filter_modulo_generator(items, modulo)
+
+
+VARIANTS = [
+    ('loop', filter_modulo_loop, list),
+    ('dense', filter_modulo_dense, list),
+    ('comprehension', filter_modulo_comprehension, list),
+    ('generator', filter_modulo_generator, list),
+    ('filter_modulo(list)', filter_modulo, list),
+    ('filter_modulo(array)', filter_modulo,
+     lambda items: array.array('q', items)),
+]
+if numpy is not None:
+    VARIANTS.append(('filter_modulo(numpy)', filter_modulo, numpy.array))
+
+
+def materialize(result):
+    '''Consume lazy results so every variant does the same work'''
+    if iter(result) is result:
+        return list(result)
+    return result
+
+
+def benchmark(sizes=(100, 10000, 1000000), modulo=3, repeat=3):
+    '''Print the best time per call of every variant'''
+    print('%-22s' % 'variant' + ''.join('%14d' % size for size in sizes))
+    for name, function, convert in VARIANTS:
+        row = '%-22s' % name
+        for size in sizes:
+            items = convert(range(size))
+            number = max(1, 100000 // size)
+            duration = min(timeit.repeat(
+                lambda: materialize(function(items, modulo)),
+                number=number, repeat=repeat)) / number
+            row += '%12.3fms' % (duration * 1000)
+        print(row)
+
+
+if __name__ == '__main__':
+    benchmark()
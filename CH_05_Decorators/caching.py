@@ -0,0 +1,295 @@
+'''
+A bounded version of the `memoize` decorator from main.ipynb.
+
+The original `memoize` stores every result in a dict forever. This one
+limits the cache by number of entries (`maxsize`), by size in bytes
+(`maxbytes`, measured with `sizeof`) and/or by age (`ttl` in seconds)
+and evicts according to a policy:
+
+- `lru`: the least recently used entry goes first (like `lru_cache`)
+- `lfu`: the least frequently used entry goes first, the oldest of
+  those when there's a tie
+- `ttl`: the entry that expires first goes first
+
+    @memoize(maxsize=1000, maxbytes=2 ** 20, policy='lfu')
+    def fibonacci(n):
+        ...
+
+    fibonacci.cache_info()
+    # CacheInfo(hits=11, misses=13, evictions=0, expirations=0, ...)
+
+Arguments that can't be hashed (lists, dicts, sets) are converted to
+hashable equivalents by the default `key` function, a custom function
+gets the `args` tuple and `kwargs` dict and returns the key.
+'''
+import sys
+import time
+import threading
+import collections
+from functools import wraps
+
+
+CacheInfo = collections.namedtuple('CacheInfo', [
+    'hits', 'misses', 'evictions', 'expirations', 'size', 'bytes',
+    'maxsize', 'maxbytes'])
+
+MISSING = object()
+KWARGS_MARK = object()
+
+
+def freeze(value):
+    '''Convert lists, dicts and sets (recursively) to hashable tuples and
+    frozensets, tagged with their type so `[1, 2]` and `(1, 2)` (or a
+    dict and a set of pairs) don't get the same key'''
+    if isinstance(value, dict):
+        return type(value), frozenset(
+            (key, freeze(item)) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        return type(value), tuple(freeze(item) for item in value)
+    elif isinstance(value, (set, frozenset)):
+        return type(value), frozenset(freeze(item) for item in value)
+    return value
+
+
+def make_key(args, kwargs):
+    key = args
+    if kwargs:
+        key += (KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        key = freeze(key)
+    return key
+
+
+class Entry:
+    __slots__ = 'value', 'size', 'expires'
+
+    def __init__(self, value, size, expires):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+class Cache:
+    '''The cache storage, subclasses implement the eviction policy'''
+
+    def __init__(self, maxsize=None, maxbytes=None, ttl=None,
+                 sizeof=sys.getsizeof):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.entries = dict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and (
+            entry.expires is None or entry.expires > time.monotonic())
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires is not None \
+                    and entry.expires <= time.monotonic():
+                self.remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.touched(key)
+            return entry.value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        if self.maxbytes is not None and size > self.maxbytes:
+            # It would push everything else out and still not fit
+            return
+
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+
+            while self.entries and (
+                    (self.maxsize is not None
+                     and len(self.entries) >= self.maxsize)
+                    or (self.maxbytes is not None
+                        and self.bytes + size > self.maxbytes)):
+                self.remove(self.victim())
+                self.evictions += 1
+
+            if self.maxsize == 0:
+                return
+
+            self.entries[key] = Entry(value, size, expires)
+            self.bytes += size
+            self.added(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        self.removed(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.remove(key)
+            self.hits = self.misses = 0
+            self.evictions = self.expirations = 0
+
+    def info(self):
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.expirations,
+            len(self.entries), self.bytes, self.maxsize, self.maxbytes)
+
+    # The policy hooks
+    def added(self, key):
+        pass
+
+    def touched(self, key):
+        pass
+
+    def removed(self, key):
+        pass
+
+    def victim(self):
+        raise NotImplementedError()
+
+
+class LRUCache(Cache):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.order = collections.OrderedDict()
+
+    def added(self, key):
+        self.order[key] = None
+
+    def touched(self, key):
+        self.order.move_to_end(key)
+
+    def removed(self, key):
+        del self.order[key]
+
+    def victim(self):
+        return next(iter(self.order))
+
+
+class LFUCache(Cache):
+    '''Keeps a bucket of keys per use count so finding the least
+    frequently used key doesn't need a scan'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counts = dict()
+        self.buckets = collections.defaultdict(collections.OrderedDict)
+        self.min_count = 0
+
+    def added(self, key):
+        self.counts[key] = 1
+        self.buckets[1][key] = None
+        self.min_count = 1
+
+    def touched(self, key):
+        count = self.counts[key]
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count:
+                self.min_count = count + 1
+        self.counts[key] = count + 1
+        self.buckets[count + 1][key] = None
+
+    def removed(self, key):
+        count = self.counts.pop(key)
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_count == count:
+                self.min_count = min(self.buckets, default=0)
+
+    def victim(self):
+        return next(iter(self.buckets[self.min_count]))
+
+
+class TTLCache(Cache):
+    '''Every entry lives `ttl` seconds so the oldest entry expires first'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.ttl is None:
+            raise ValueError('The ttl policy needs a ttl')
+        self.order = collections.OrderedDict()
+
+    def added(self, key):
+        self.order[key] = None
+
+    def removed(self, key):
+        del self.order[key]
+
+    def victim(self):
+        return next(iter(self.order))
+
+    def set(self, key, value):
+        self.expire()
+        super().set(key, value)
+
+    def expire(self):
+        '''Remove all expired entries'''
+        now = time.monotonic()
+        with self.lock:
+            while self.order:
+                key = next(iter(self.order))
+                if self.entries[key].expires > now:
+                    break
+                self.remove(key)
+                self.expirations += 1
+
+
+POLICIES = dict(lru=LRUCache, lfu=LFUCache, ttl=TTLCache)
+
+
+def memoize(function=None, policy='lru', maxsize=None, maxbytes=None,
+            ttl=None, key=make_key, sizeof=sys.getsizeof):
+    '''Cache the results of `function`, usable as `@memoize` and as
+    `@memoize(maxsize=..., ...)`'''
+    if function is None:
+        def _memoize_decorator(function):
+            return memoize(function, policy, maxsize, maxbytes, ttl, key,
+                           sizeof)
+        return _memoize_decorator
+
+    cache = POLICIES[policy](maxsize, maxbytes, ttl, sizeof)
+
+    @wraps(function)
+    def _memoize(*args, **kwargs):
+        cache_key = key(args, kwargs)
+        value = cache.get(cache_key, MISSING)
+        if value is MISSING:
+            value = function(*args, **kwargs)
+            cache.set(cache_key, value)
+        return value
+
+    _memoize.cache = cache
+    _memoize.cache_info = cache.info
+    _memoize.cache_clear = cache.clear
+    return _memoize
@@ -0,0 +1,343 @@
+'''
+Timing and counting decorators that can stay on in production.
+
+`profile_execution_time` and `timer_decorator_factory` in extra_1.ipynb
+(and `counter`/`debug` in main.ipynb) print on every call. The
+decorators here record into histograms instead, and an `Exporter`
+thread writes a summary every `interval` seconds:
+
+    @timed(sample=100)
+    def complex_algorithm(n):
+        ...
+
+    Exporter(interval=10).start()
+    # complex_algorithm: 1200 calls, mean 0.035ms, p50 0.031ms, ...
+
+Every thread records into its own histogram, so recording never takes a
+lock. With `sample=N` only one in N calls is timed (and counted N
+times), which makes the overhead of an untimed call a single counter
+increment. Run this file to see the overhead.
+'''
+import sys
+import time
+import logging
+import itertools
+import threading
+from functools import wraps
+
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+BUCKETS = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+UNITS = dict(seconds=1, milliseconds=1e3, microseconds=1e6)
+
+
+def bucket_index(ns):
+    '''Log-linear buckets: exact below 8ns and 8 buckets per power of two
+    above that, so the middle of a bucket is within 6.25% of the values
+    in it'''
+    bits = ns.bit_length()
+    if bits <= SUB_BUCKET_BITS:
+        return ns
+    return (bits - SUB_BUCKET_BITS) * SUB_BUCKETS \
+        + (ns >> (bits - SUB_BUCKET_BITS - 1)) - SUB_BUCKETS
+
+
+def bucket_value(index):
+    '''The middle of the bucket in nanoseconds'''
+    if index < SUB_BUCKETS:
+        return index
+    bits = index // SUB_BUCKETS + SUB_BUCKET_BITS
+    shift = bits - SUB_BUCKET_BITS - 1
+    low = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low + (1 << shift) / 2
+
+
+class Histogram:
+    '''Only written by a single thread. The histograms of `counted` are
+    not `timed`, only their count is used.'''
+
+    def __init__(self, timed=True):
+        self.timed = timed
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+        # Set for the deltas of the `Exporter`
+        self.max_since_start = False
+
+    def record(self, ns, weight=1):
+        # `bucket_index` inlined, this runs on every timed call
+        bits = ns.bit_length()
+        if bits <= SUB_BUCKET_BITS:
+            index = ns
+        else:
+            index = (bits - SUB_BUCKET_BITS) * SUB_BUCKETS \
+                + (ns >> (bits - SUB_BUCKET_BITS - 1)) - SUB_BUCKETS
+        self.buckets[index] += weight
+        self.count += weight
+        self.sum += ns * weight
+        if ns > self.max:
+            self.max = ns
+
+
+class Metric:
+    '''A histogram per thread that are merged when reading'''
+
+    def __init__(self, name, timed=True):
+        self.name = name
+        self.timed = timed
+        self.local = threading.local()
+        self.histograms = []
+        self.lock = threading.Lock()
+
+    def histogram(self):
+        try:
+            return self.local.histogram
+        except AttributeError:
+            histogram = self.local.histogram = Histogram(self.timed)
+            # Only the first call of every thread takes the lock
+            with self.lock:
+                self.histograms.append(histogram)
+            return histogram
+
+    def record(self, ns, weight=1):
+        self.histogram().record(ns, weight)
+
+    def merged(self):
+        merged = Histogram(self.timed)
+        with self.lock:
+            histograms = list(self.histograms)
+        for histogram in histograms:
+            for index, count in enumerate(list(histogram.buckets)):
+                merged.buckets[index] += count
+            merged.count += histogram.count
+            merged.sum += histogram.sum
+            merged.max = max(merged.max, histogram.max)
+        return merged
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def metric(self, name, timed=True):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Metric(name, timed)
+            metric = self.metrics[name]
+        if metric.timed != timed:
+            raise ValueError('%s is already used by a %s metric' % (
+                name, 'timed' if metric.timed else 'counted'))
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.merged() for metric in metrics}
+
+
+registry = Registry()
+
+
+def percentile(histogram, percent):
+    if not histogram.count:
+        return 0
+    rank = histogram.count * percent / 100
+    seen = 0
+    for index, count in enumerate(histogram.buckets):
+        seen += count
+        if count and seen >= rank:
+            # The middle of the bucket can be above the largest value
+            return min(bucket_value(index), histogram.max)
+    return histogram.max
+
+
+def summary(name, histogram, unit='milliseconds'):
+    scale = UNITS[unit] / 1e9
+    symbol = dict(seconds='s', milliseconds='ms', microseconds='us')[unit]
+    if not histogram.timed or not histogram.count:
+        return '%s: %d calls' % (name, histogram.count)
+    return '%s: %d calls, mean %.3f%s, p50 %.3f%s, p99 %.3f%s, ' \
+        '%s %.3f%s' % (
+            name, histogram.count,
+            histogram.sum / histogram.count * scale, symbol,
+            percentile(histogram, 50) * scale, symbol,
+            percentile(histogram, 99) * scale, symbol,
+            'max since start' if histogram.max_since_start else 'max',
+            histogram.max * scale, symbol)
+
+
+def timed(function=None, sample=1, name=None, registry=registry):
+    '''Record the duration of one in `sample` calls, usable with and
+    without arguments'''
+    if function is None:
+        def _timed_decorator(function):
+            return timed(function, sample, name, registry)
+        return _timed_decorator
+
+    metric = registry.metric(name or function.__qualname__)
+    local = metric.local
+    calls = itertools.count()
+    perf_counter_ns = time.perf_counter_ns
+
+    @wraps(function)
+    def _timed(*args, **kwargs):
+        if sample > 1 and next(calls) % sample:
+            return function(*args, **kwargs)
+
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = perf_counter_ns() - start
+            try:
+                histogram = local.histogram
+            except AttributeError:
+                histogram = metric.histogram()
+            histogram.record(duration, sample)
+
+    _timed.metric = metric
+    return _timed
+
+
+def counted(function=None, name=None, registry=registry):
+    '''Count the calls without timing them, the lock-free replacement of
+    `counter` from main.ipynb'''
+    if function is None:
+        def _counted_decorator(function):
+            return counted(function, name, registry)
+        return _counted_decorator
+
+    metric = registry.metric(name or function.__qualname__, timed=False)
+    local = metric.local
+
+    @wraps(function)
+    def _counted(*args, **kwargs):
+        try:
+            local.histogram.count += 1
+        except AttributeError:
+            metric.histogram().count += 1
+        return function(*args, **kwargs)
+
+    _counted.metric = metric
+    return _counted
+
+
+def traced(function=None, sample=1000, level=logging.DEBUG):
+    '''Log the arguments and result of one in `sample` calls, the
+    sampling version of `debug` from main.ipynb'''
+    if function is None:
+        def _traced_decorator(function):
+            return traced(function, sample, level)
+        return _traced_decorator
+
+    calls = itertools.count()
+
+    @wraps(function)
+    def _traced(*args, **kwargs):
+        output = function(*args, **kwargs)
+        if not next(calls) % sample and logger.isEnabledFor(level):
+            logger.log(level, '%s(%r, %r): %r', function.__name__, args,
+                       kwargs, output)
+        return output
+
+    return _traced
+
+
+class Exporter(threading.Thread):
+    '''Exports the calls of the last `interval` seconds of every metric,
+    by default to the log. The maximum can't be computed per interval, it's
+    the maximum since the start (labelled as such).'''
+
+    def __init__(self, interval=10, export=None, registry=registry,
+                 unit='milliseconds'):
+        super().__init__(name='instrumentation-exporter', daemon=True)
+        self.interval = interval
+        self.export = export or self.log
+        self.registry = registry
+        self.unit = unit
+        self.previous = dict()
+        self.stopped = threading.Event()
+
+    def log(self, deltas):
+        for name, histogram in sorted(deltas.items()):
+            logger.info(summary(name, histogram, self.unit))
+
+    def collect(self):
+        '''The difference with the previous snapshot, so the writers never
+        have to reset anything'''
+        snapshot = self.registry.snapshot()
+        deltas = dict()
+        for name, histogram in snapshot.items():
+            previous = self.previous.get(name)
+            if previous is not None:
+                delta = Histogram(histogram.timed)
+                delta.buckets = [
+                    count - previous_count for count, previous_count
+                    in zip(histogram.buckets, previous.buckets)]
+                delta.count = histogram.count - previous.count
+                delta.sum = histogram.sum - previous.sum
+                # Per thread maxima can't be subtracted, this is the
+                # maximum since the start
+                delta.max = histogram.max
+                delta.max_since_start = True
+                histogram, self.previous[name] = delta, histogram
+            else:
+                self.previous[name] = histogram
+            deltas[name] = histogram
+        return deltas
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export(self.collect())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        # Whatever was recorded since the last export
+        self.export(self.collect())
+
+
+def overhead(calls=1000000):
+    '''Compare the cost of calling a function bare and decorated'''
+    def function(n):
+        return n
+
+    variants = (
+        ('bare', function),
+        ('timed', timed(function, name='overhead timed')),
+        ('timed(sample=100)',
+         timed(function, sample=100, name='overhead sampled')),
+        ('counted', counted(function, name='overhead counted')),
+    )
+    for name, variant in variants:
+        start = time.perf_counter()
+        for i in range(calls):
+            variant(i)
+        duration = time.perf_counter() - start
+        print('%-20s %8.1fns per call' % (name, duration / calls * 1e9))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    overhead()
+
+    @timed(sample=10)
+    def complex_algorithm(n):
+        '''The function from extra_1.ipynb'''
+        result = 0
+        for i in range(n):
+            result += i
+        return result
+
+    exporter = Exporter(interval=0.5)
+    exporter.start()
+    for i in range(2000):
+        complex_algorithm(i * 10)
+    exporter.stop()
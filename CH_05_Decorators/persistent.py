@@ -0,0 +1,242 @@
+'''
+Memoization that survives a restart of the process.
+
+`persistent_memoize` puts a SQLite database behind the in-memory cache
+of `caching.memoize`. A lookup tries the memory first, then the
+database, and only calls the function when both miss:
+
+    @persistent_memoize('cache.sqlite', maxsize=1000)
+    def fibonacci(n):
+        ...
+
+The arguments are hashed into a key that is the same in every process
+(unlike `hash()`, which is randomized for strings), and every key is
+combined with a hash of the code of the function so changing the
+function invalidates its old results. The results of older versions
+stay in the database for processes that still run them, until they're
+removed with `DiskCache.purge`.
+
+Several processes can use the same file at once: the database uses
+write-ahead logging, so readers never wait for a writer and writers
+wait (up to `timeout` seconds) for each other. A value computed by two
+processes at the same time is simply stored twice.
+'''
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from functools import wraps
+
+from caching import MISSING, POLICIES
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    function TEXT NOT NULL,
+    version TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (function, version, key)
+)
+'''
+
+
+def encode(value, parts):
+    '''Append a canonical representation of the value to `parts`, dicts
+    and sets are sorted so their order doesn't matter'''
+    if value is None or isinstance(value, (bool, int, float, complex, str,
+                                           bytes)):
+        parts.append('%s:%r' % (type(value).__name__, value))
+    elif isinstance(value, (tuple, list)):
+        parts.append('%s:%d(' % (type(value).__name__, len(value)))
+        for item in value:
+            encode(item, parts)
+        parts.append(')')
+    elif isinstance(value, dict):
+        items = []
+        for key, item in value.items():
+            item_parts = []
+            encode(key, item_parts)
+            encode(item, item_parts)
+            items.append(''.join(item_parts))
+        parts.append('dict:%d(%s)' % (len(items), ''.join(sorted(items))))
+    elif isinstance(value, (set, frozenset)):
+        items = []
+        for item in value:
+            item_parts = []
+            encode(item, item_parts)
+            items.append(''.join(item_parts))
+        parts.append('set:%d(%s)' % (len(items), ''.join(sorted(items))))
+    else:
+        # Anything else has to pickle the same way in every process
+        parts.append('pickle:%s' % pickle.dumps(value, protocol=4).hex())
+
+
+def stable_key(args, kwargs):
+    parts = []
+    encode(args, parts)
+    encode(kwargs, parts)
+    return hashlib.sha256(''.join(parts).encode()).hexdigest()
+
+
+def code_version(function):
+    '''A hash of the bytecode, constants and names of the function (and
+    the functions defined inside it), its default arguments and the
+    values of its closure, but not of its line numbers'''
+    digest = hashlib.sha256()
+    seen = set()
+
+    def update_value(value):
+        if hasattr(value, '__code__'):
+            update_function(value)
+            return
+        parts = []
+        try:
+            encode(value, parts)
+        except Exception:
+            # Can't be pickled (a lock for example), only the type counts
+            parts = ['unpicklable:%s' % type(value).__qualname__]
+        digest.update(''.join(parts).encode())
+
+    def update_function(function):
+        if function.__code__ in seen:
+            # Recursive closures
+            return
+        seen.add(function.__code__)
+        update(function.__code__)
+        update_value(function.__defaults__)
+        update_value(function.__kwdefaults__)
+        for cell in function.__closure__ or ():
+            try:
+                update_value(cell.cell_contents)
+            except ValueError:
+                # An empty cell
+                digest.update(b'empty')
+
+    def update(code):
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode())
+        digest.update(repr(code.co_varnames).encode())
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                update(const)
+            else:
+                # Not `repr`, the order of a frozenset constant (from
+                # `x in {'a', 'b'}`) depends on the hash seed
+                parts = []
+                encode(const, parts)
+                digest.update(''.join(parts).encode())
+
+    update_function(function)
+    return digest.hexdigest()[:16]
+
+
+class DiskCache:
+    '''A SQLite table of pickled values shared between threads and
+    processes, every thread (and forked process) gets its own
+    connection'''
+
+    def __init__(self, filename, timeout=30):
+        self.filename = filename
+        self.timeout = timeout
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            connection = sqlite3.connect(
+                self.filename, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Committed data survives a crash of the process, only a
+            # crash of the machine can lose the last writes
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self.local.connection = connection
+            self.local.pid = pid
+        return self.local.connection
+
+    def get(self, function, version, key, ttl=None):
+        row = self.connection.execute(
+            'SELECT value, created FROM cache '
+            'WHERE function = ? AND key = ? AND version = ?',
+            (function, key, version)).fetchone()
+        if row is None:
+            return MISSING
+        value, created = row
+        if ttl is not None and created + ttl <= time.time():
+            return MISSING
+        return pickle.loads(value)
+
+    def set(self, function, version, key, value):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cache '
+            '(function, version, key, value, created) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (function, version, key, pickle.dumps(value), time.time()))
+
+    def purge(self, function, version=None, ttl=None):
+        '''Remove the results of other versions of the function and the
+        expired ones'''
+        with self.connection:
+            if version is not None:
+                self.connection.execute(
+                    'DELETE FROM cache WHERE function = ? AND version != ?',
+                    (function, version))
+            if ttl is not None:
+                self.connection.execute(
+                    'DELETE FROM cache WHERE function = ? AND created <= ?',
+                    (function, time.time() - ttl))
+
+    def clear(self, function):
+        self.connection.execute(
+            'DELETE FROM cache WHERE function = ?', (function,))
+
+
+def persistent_memoize(filename, policy='lru', maxsize=1000, ttl=None,
+                       key=stable_key):
+    '''Memoize in memory (`policy`, `maxsize` and `ttl` as in
+    `caching.memoize`) and in the SQLite database `filename`'''
+    disk = DiskCache(filename)
+
+    def _persistent_memoize_decorator(function):
+        name = '%s.%s' % (function.__module__, function.__qualname__)
+        version = code_version(function)
+        # Only the expired results, other processes might still run an
+        # older version of the function
+        disk.purge(name, ttl=ttl)
+        memory = POLICIES[policy](maxsize=maxsize, ttl=ttl)
+
+        @wraps(function)
+        def _persistent_memoize(*args, **kwargs):
+            cache_key = key(args, kwargs)
+            value = memory.get(cache_key, MISSING)
+            if value is not MISSING:
+                return value
+
+            value = disk.get(name, version, cache_key, ttl)
+            if value is MISSING:
+                _persistent_memoize.disk_misses += 1
+                value = function(*args, **kwargs)
+                disk.set(name, version, cache_key, value)
+            else:
+                _persistent_memoize.disk_hits += 1
+            memory.set(cache_key, value)
+            return value
+
+        def cache_clear():
+            memory.clear()
+            disk.clear(name)
+
+        _persistent_memoize.disk_hits = 0
+        _persistent_memoize.disk_misses = 0
+        _persistent_memoize.cache = memory
+        _persistent_memoize.disk = disk
+        _persistent_memoize.cache_info = memory.info
+        _persistent_memoize.cache_clear = cache_clear
+        return _persistent_memoize
+
+    return _persistent_memoize_decorator
@@ -0,0 +1,435 @@
+'''
+A connection pool to use instead of the `singleton` decorator.
+
+With `@singleton` (extra_1.ipynb) every caller shares one
+`DatabaseConnection`, so concurrent requests wait for each other. The
+`pooled` class decorator gives every caller a connection of its own
+from a pool of at most `max_size` connections instead:
+
+    @pooled(min_size=2, max_size=10, idle_timeout=60)
+    class DatabaseConnection:
+        def __init__(self, connection_string):
+            ...
+
+    pool = DatabaseConnection('db_connection_string_1')
+    with pool.connection() as db:
+        ...
+
+Like `singleton` the same arguments return the same pool. `Pool` and
+`AsyncPool` can also be used directly with any function that creates a
+connection:
+
+- connections are checked with `check` before they are handed out
+  (when they were idle for `check_after` seconds), broken connections
+  are replaced
+- connections idle for more than `idle_timeout` seconds are closed,
+  down to `min_size` connections, whenever a connection is acquired or
+  released (there's no background thread, a pool that isn't used at all
+  keeps its connections)
+- `acquire` raises `PoolTimeout` when no connection came available
+  within `timeout` seconds
+'''
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import contextlib
+import collections
+from functools import wraps
+
+
+logger = logging.getLogger(__name__)
+
+PoolStats = collections.namedtuple('PoolStats', [
+    'size', 'idle', 'in_use', 'waiting', 'created', 'closed', 'timeouts',
+    'failed_checks'])
+
+
+class PoolTimeout(TimeoutError):
+    pass
+
+
+def close_connection(connection):
+    close = getattr(connection, 'close', None)
+    if close is not None:
+        return close()
+
+
+class BasePool:
+    '''The bookkeeping shared by the thread and asyncio pools'''
+
+    def __init__(self, factory, min_size=1, max_size=10, timeout=30,
+                 idle_timeout=300, check=None, check_after=0,
+                 close=close_connection):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Need 0 <= min_size <= max_size and '
+                             'max_size >= 1')
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.check = check
+        self.check_after = check_after
+        self.close_function = close
+        # (connection, released at) with the most recently used
+        # connection on the right
+        self.idle = collections.deque()
+        self.in_use = set()
+        # Connections that are being created count towards the size
+        self.size = 0
+        self.waiting = 0
+        self.closed = False
+        self.counters = collections.Counter()
+
+    def expired(self, now):
+        '''Pop the idle connections that can be closed'''
+        connections = []
+        while self.idle and self.size > self.min_size \
+                and now - self.idle[0][1] > self.idle_timeout:
+            connections.append(self.idle.popleft()[0])
+            self.size -= 1
+        return connections
+
+    def needs_check(self, released, now):
+        return self.check is not None and now - released >= self.check_after
+
+    def stats(self):
+        return PoolStats(
+            self.size, len(self.idle), len(self.in_use), self.waiting,
+            self.counters['created'], self.counters['closed'],
+            self.counters['timeouts'], self.counters['failed_checks'])
+
+
+class Pool(BasePool):
+    '''A pool for threads'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = threading.Condition()
+        for _ in range(self.min_size):
+            with self.condition:
+                self.size += 1
+            self.release(self.create())
+
+    def create(self):
+        try:
+            connection = self.factory()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self.counters['created'] += 1
+        return connection
+
+    def discard(self, connection):
+        try:
+            self.close_function(connection)
+        except Exception:
+            logger.exception('Closing %r failed', connection)
+        finally:
+            self.counters['closed'] += 1
+
+    def put_back(self, connection, released):
+        '''Undo taking `connection` from the idle connections, or
+        reserving a slot when it's None'''
+        with self.condition:
+            if connection is None:
+                self.size -= 1
+            else:
+                self.idle.append((connection, released))
+            self.condition.notify()
+
+    def healthy(self, connection):
+        try:
+            return self.check(connection) is not False
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    if self.closed:
+                        raise RuntimeError('The pool is closed')
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            'No connection available within %.3f '
+                            'seconds' % timeout)
+                    self.waiting += 1
+                    try:
+                        self.condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+
+                if self.closed:
+                    raise RuntimeError('The pool is closed')
+                now = time.monotonic()
+                expired = self.expired(now)
+                if self.idle:
+                    connection, released = self.idle.pop()
+                else:
+                    # Reserve the slot, the connection is created
+                    # outside of the lock
+                    connection = released = None
+                    self.size += 1
+
+            try:
+                for expired_connection in expired:
+                    self.discard(expired_connection)
+            except BaseException:
+                self.put_back(connection, released)
+                raise
+
+            if connection is None:
+                connection = self.create()
+            elif self.needs_check(released, now) \
+                    and not self.healthy(connection):
+                self.counters['failed_checks'] += 1
+                self.discard(connection)
+                with self.condition:
+                    self.size -= 1
+                    self.condition.notify()
+                continue
+
+            with self.condition:
+                self.in_use.add(connection)
+            return connection
+
+    def release(self, connection, discard=False):
+        '''Return the connection to the pool, `discard` closes it (for a
+        connection that's known to be broken)'''
+        now = time.monotonic()
+        with self.condition:
+            self.in_use.discard(connection)
+            if discard or self.closed:
+                self.size -= 1
+            else:
+                self.idle.append((connection, now))
+                connection = None
+            expired = self.expired(now)
+            self.condition.notify()
+
+        if connection is not None:
+            self.discard(connection)
+        for expired_connection in expired:
+            self.discard(expired_connection)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException:
+            # The connection might be in an unknown state
+            self.release(connection, discard=True)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        '''Close the idle connections, the ones in use are closed when
+        they are released'''
+        with self.condition:
+            self.closed = True
+            connections = [connection for connection, _ in self.idle]
+            self.idle.clear()
+            self.size -= len(connections)
+            self.condition.notify_all()
+        for connection in connections:
+            self.discard(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+async def maybe_await(value):
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncPool(BasePool):
+    '''A pool for asyncio, `factory`, `check` and `close` can be regular
+    or `async` functions. Call `fill` (or use `async with`) to create
+    the first `min_size` connections.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = asyncio.Condition()
+
+    async def fill(self):
+        while self.size < self.min_size:
+            self.size += 1
+            await self.release(await self.create())
+
+    async def create(self):
+        try:
+            connection = await maybe_await(self.factory())
+        except BaseException:
+            self.size -= 1
+            async with self.condition:
+                self.condition.notify()
+            raise
+        self.counters['created'] += 1
+        return connection
+
+    async def discard(self, connection):
+        try:
+            await maybe_await(self.close_function(connection))
+        except Exception:
+            logger.exception('Closing %r failed', connection)
+        finally:
+            self.counters['closed'] += 1
+
+    async def put_back(self, connection, released):
+        if connection is None:
+            self.size -= 1
+        else:
+            self.idle.append((connection, released))
+        async with self.condition:
+            self.condition.notify()
+
+    async def healthy(self, connection):
+        try:
+            return await maybe_await(self.check(connection)) is not False
+        except Exception:
+            return False
+
+    async def acquire(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return await asyncio.wait_for(self._acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            raise PoolTimeout('No connection available within %.3f '
+                              'seconds' % timeout) from None
+
+    async def _acquire(self):
+        while True:
+            async with self.condition:
+                self.waiting += 1
+                try:
+                    await self.condition.wait_for(
+                        lambda: self.closed or self.idle
+                        or self.size < self.max_size)
+                finally:
+                    self.waiting -= 1
+
+                if self.closed:
+                    raise RuntimeError('The pool is closed')
+                now = time.monotonic()
+                expired = self.expired(now)
+                if self.idle:
+                    connection, released = self.idle.pop()
+                else:
+                    connection = released = None
+                    self.size += 1
+
+            try:
+                for expired_connection in expired:
+                    await self.discard(expired_connection)
+            except BaseException:
+                # Cancelled by the timeout while closing
+                await self.put_back(connection, released)
+                raise
+
+            if connection is None:
+                connection = await self.create()
+            elif self.needs_check(released, now):
+                try:
+                    healthy = await self.healthy(connection)
+                except BaseException:
+                    # Cancelled by the timeout while checking
+                    self.idle.append((connection, released))
+                    raise
+                if not healthy:
+                    self.counters['failed_checks'] += 1
+                    self.size -= 1
+                    await self.discard(connection)
+                    continue
+
+            self.in_use.add(connection)
+            return connection
+
+    async def release(self, connection, discard=False):
+        now = time.monotonic()
+        self.in_use.discard(connection)
+        if discard or self.closed:
+            self.size -= 1
+        else:
+            self.idle.append((connection, now))
+            connection = None
+        expired = self.expired(now)
+        async with self.condition:
+            self.condition.notify()
+
+        if connection is not None:
+            await self.discard(connection)
+        for expired_connection in expired:
+            await self.discard(expired_connection)
+
+    @contextlib.asynccontextmanager
+    async def connection(self, timeout=None):
+        connection = await self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException:
+            await self.release(connection, discard=True)
+            raise
+        else:
+            await self.release(connection)
+
+    async def close(self):
+        self.closed = True
+        connections = [connection for connection, _ in self.idle]
+        self.idle.clear()
+        self.size -= len(connections)
+        for connection in connections:
+            await self.discard(connection)
+        async with self.condition:
+            self.condition.notify_all()
+
+    async def __aenter__(self):
+        await self.fill()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def pooled(cls=None, pool_class=Pool, **options):
+    '''Class decorator, calling the class returns the pool of instances
+    for those arguments. Usable as `@pooled` and `@pooled(max_size=...)`
+    with the options of `Pool`.'''
+    if cls is None:
+        def _pooled_decorator(cls):
+            return pooled(cls, pool_class, **options)
+        return _pooled_decorator
+
+    pools = dict()
+    lock = threading.Lock()
+
+    @wraps(cls, updated=())
+    def get_pool(*args, **kwargs):
+        key = args, tuple(sorted(kwargs.items()))
+        with lock:
+            if key not in pools:
+                pools[key] = pool_class(
+                    lambda: cls(*args, **kwargs), **options)
+            return pools[key]
+
+    get_pool.pools = pools
+    return get_pool
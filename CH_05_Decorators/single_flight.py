@@ -0,0 +1,270 @@
+'''
+A cache decorator that computes every value only once, even when many
+threads or tasks ask for it at the same time.
+
+With `memoize` or `lru_cache` every caller that misses the cache calls
+the function, so a burst of 100 requests for the same expensive value
+does the work 100 times (a cache stampede). `cached` lets the first
+caller compute the value while the others with the same key wait for
+that result (single-flight). Calls with different keys don't wait for
+each other, so this works like a lock per key.
+
+With `stale` set, values older than `ttl` are still returned for
+another `stale` seconds while a single background refresh replaces
+them (stale-while-revalidate), so callers never wait for an expired
+value:
+
+    @cached(ttl=60, stale=30, maxsize=1000)
+    def complex_algorithm(n):
+        ...
+
+    @cached(ttl=60)
+    async def fetch(url):
+        ...
+
+`async def` functions are detected automatically. The cache itself is
+one of the policies from `caching.py`.
+'''
+import sys
+import time
+import inspect
+import asyncio
+import logging
+import threading
+import collections
+from functools import wraps
+
+from caching import MISSING, POLICIES, make_key
+
+
+logger = logging.getLogger(__name__)
+
+FlightInfo = collections.namedtuple(
+    'FlightInfo', ['calls', 'shared', 'stale', 'refreshes'])
+
+
+class Flight:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    '''Runs a function once per key for all concurrent callers'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = dict()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, function, *args):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = function(*args)
+        except BaseException as exception:
+            flight.error = exception
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+        return flight.value
+
+
+class AsyncSingleFlight:
+    '''The asyncio version, the function runs in its own task so a
+    cancelled caller doesn't cancel it for the others'''
+
+    def __init__(self):
+        self.flights = dict()
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, function, *args):
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args))
+            self.flights[key] = task
+            task.add_done_callback(
+                lambda task: self.done(key, task))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def done(self, key, task):
+        if self.flights.get(key) is task:
+            del self.flights[key]
+        if not task.cancelled():
+            # Retrieve the error so it's not logged when every caller
+            # was cancelled
+            task.exception()
+
+
+def cached(function=None, policy='lru', maxsize=None, maxbytes=None,
+           ttl=None, stale=0, key=make_key, sizeof=sys.getsizeof):
+    '''Cache with single-flight misses and optionally
+    stale-while-revalidate, usable with and without arguments'''
+    if function is None:
+        def _cached_decorator(function):
+            return cached(function, policy, maxsize, maxbytes, ttl, stale,
+                          key, sizeof)
+        return _cached_decorator
+
+    # The cache stores (value, fresh until) and keeps the values during
+    # the stale period as well
+    cache = POLICIES[policy](
+        maxsize, maxbytes, None if ttl is None else ttl + stale,
+        lambda entry: sizeof(entry[0]))
+    counters = collections.Counter()
+
+    def fresh_until():
+        return None if ttl is None else time.monotonic() + ttl
+
+    def is_fresh(until):
+        return until is None or until > time.monotonic()
+
+    def lookup(cache_key):
+        '''Return the cached value and whether it needs a refresh'''
+        entry = cache.get(cache_key, MISSING)
+        if entry is MISSING:
+            return MISSING, False
+        value, until = entry
+        if is_fresh(until):
+            return value, False
+        counters['stale'] += 1
+        return value, cache_key not in flight.flights
+
+    def lookup_fresh(cache_key):
+        '''The fresh value or MISSING, the leader of a flight checks
+        again as the previous flight might have finished after the
+        caller missed the cache'''
+        value, until = cache.get(cache_key, (MISSING, None))
+        return value if is_fresh(until) else MISSING
+
+    if inspect.iscoroutinefunction(function):
+        flight = AsyncSingleFlight()
+        refreshes = set()
+
+        async def compute(cache_key, args, kwargs):
+            value = lookup_fresh(cache_key)
+            if value is not MISSING:
+                return value
+            value = await function(*args, **kwargs)
+            cache.set(cache_key, (value, fresh_until()))
+            return value
+
+        async def refresh(cache_key, args, kwargs):
+            try:
+                await flight.do(cache_key, compute, cache_key, args, kwargs)
+            except Exception:
+                logger.exception('Refreshing %s%r failed, keeping the '
+                                 'stale value', function.__name__, args)
+
+        @wraps(function)
+        async def _cached(*args, **kwargs):
+            cache_key = key(args, kwargs)
+            value, needs_refresh = lookup(cache_key)
+            if value is MISSING:
+                return await flight.do(cache_key, compute, cache_key, args,
+                                       kwargs)
+            if needs_refresh:
+                counters['refreshes'] += 1
+                # Keep a reference, the loop only has a weak one
+                task = asyncio.ensure_future(
+                    refresh(cache_key, args, kwargs))
+                refreshes.add(task)
+                task.add_done_callback(refreshes.discard)
+            return value
+    else:
+        flight = SingleFlight()
+
+        def compute(cache_key, args, kwargs):
+            value = lookup_fresh(cache_key)
+            if value is not MISSING:
+                return value
+            value = function(*args, **kwargs)
+            cache.set(cache_key, (value, fresh_until()))
+            return value
+
+        def refresh(cache_key, args, kwargs):
+            try:
+                flight.do(cache_key, compute, cache_key, args, kwargs)
+            except Exception:
+                logger.exception('Refreshing %s%r failed, keeping the '
+                                 'stale value', function.__name__, args)
+
+        @wraps(function)
+        def _cached(*args, **kwargs):
+            cache_key = key(args, kwargs)
+            value, needs_refresh = lookup(cache_key)
+            if value is MISSING:
+                return flight.do(cache_key, compute, cache_key, args, kwargs)
+            if needs_refresh:
+                counters['refreshes'] += 1
+                threading.Thread(target=refresh, args=(
+                    cache_key, args, kwargs), daemon=True).start()
+            return value
+
+    def flight_info():
+        return FlightInfo(flight.calls, flight.shared, counters['stale'],
+                          counters['refreshes'])
+
+    _cached.cache = cache
+    _cached.cache_info = cache.info
+    _cached.cache_clear = cache.clear
+    _cached.flight_info = flight_info
+    return _cached
+
+
+if __name__ == '__main__':
+    import concurrent.futures
+
+    @cached(ttl=0.5, stale=10)
+    def complex_algorithm(n):
+        '''The function from extra_1.ipynb'''
+        result = 0
+        for i in range(n):
+            result += i
+        return result
+
+    # A burst of 50 callers computes the value only once
+    with concurrent.futures.ThreadPoolExecutor(50) as executor:
+        results = list(executor.map(complex_algorithm, [1000000] * 50))
+    print('%d results, %r' % (len(results), complex_algorithm.flight_info()))
+
+    # Once expired the stale value is returned while it's refreshed
+    time.sleep(0.6)
+    start = time.perf_counter()
+    complex_algorithm(1000000)
+    print('stale result in %.3fms, %r' % (
+        (time.perf_counter() - start) * 1000,
+        complex_algorithm.flight_info()))
+
+    @cached
+    async def fetch(delay):
+        await asyncio.sleep(delay)
+        return delay
+
+    async def main():
+        await asyncio.gather(*(fetch(0.1) for _ in range(50)))
+        print('async: %r' % (fetch.flight_info(),))
+
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from instrumentation import (
+    BUCKETS, Histogram, Registry, Exporter, bucket_index, bucket_value,
+    percentile, summary, timed, counted)
+
+
+def test_bucket_round_trip():
+    values = list(range(10000)) + [
+        (1 << bits) + offset for bits in range(14, 64)
+        for offset in (-1, 0, 1)]
+    for ns in values:
+        index = bucket_index(ns)
+        assert 0 <= index < BUCKETS
+        assert abs(bucket_value(index) - ns) <= ns / 16
+    assert bucket_value(bucket_index(7)) == 7
+    assert bucket_index((1 << 64) - 1) == BUCKETS - 1
+
+
+def test_record_matches_bucket_index():
+    histogram = Histogram()
+    for ns in (0, 5, 8, 100, 12345, 10 ** 9):
+        histogram.record(ns)
+        assert histogram.buckets[bucket_index(ns)] == 1
+    assert histogram.count == 6
+    assert histogram.max == 10 ** 9
+
+
+def test_percentile():
+    histogram = Histogram()
+    for ns in range(1, 101):
+        histogram.record(ns * 1000)
+    assert abs(percentile(histogram, 50) - 50000) <= 50000 / 16
+    assert abs(percentile(histogram, 99) - 99000) <= 99000 / 16
+    assert percentile(histogram, 100) <= histogram.max
+    assert percentile(Histogram(), 50) == 0
+
+
+def test_sampling_weights():
+    registry = Registry()
+
+    @timed(sample=10, registry=registry)
+    def function(n):
+        return n
+
+    for i in range(100):
+        function(i)
+    histogram = function.metric.merged()
+    assert histogram.count == 100
+    assert sum(histogram.buckets) == 100
+    assert histogram.sum >= 10 * histogram.max
+
+
+def test_threads_are_merged():
+    registry = Registry()
+
+    @timed(registry=registry)
+    def function():
+        pass
+
+    def worker():
+        for _ in range(100):
+            function()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(function.metric.histograms) == 4
+    assert function.metric.merged().count == 400
+
+
+def test_counted_summary():
+    registry = Registry()
+
+    @counted(registry=registry)
+    def function():
+        pass
+
+    for _ in range(3):
+        function()
+    assert summary('function', function.metric.merged()) \
+        == 'function: 3 calls'
+
+    with pytest.raises(ValueError):
+        timed(function, name=function.metric.name, registry=registry)
+
+
+def test_untimed_durations_summary():
+    # A timed metric with durations below the clock resolution
+    histogram = Histogram()
+    histogram.record(0, 3)
+    assert summary('fast', histogram) == 'fast: 3 calls, mean 0.000ms, ' \
+        'p50 0.000ms, p99 0.000ms, max 0.000ms'
+
+
+def test_exporter_deltas():
+    registry = Registry()
+    exports = []
+    exporter = Exporter(export=exports.append, registry=registry)
+    metric = registry.metric('work')
+    metric.record(1000)
+    metric.record(10 ** 6)
+    first = exporter.collect()['work']
+    assert first.count == 2
+    assert not first.max_since_start
+
+    metric.record(2000, weight=5)
+    delta = exporter.collect()['work']
+    assert delta.count == 5
+    assert delta.sum == 10000
+    assert sum(delta.buckets) == 5
+    assert delta.buckets[bucket_index(2000)] == 5
+    assert delta.max == 10 ** 6
+    assert 'max since start 1.000ms' in summary('work', delta)
+
+    assert exporter.collect()['work'].count == 0
+    exporter.start()
+    exporter.stop()
+    assert exports and exports[-1]['work'].count == 0
@@ -0,0 +1,76 @@
+import os
+import sys
+import subprocess
+
+from persistent import persistent_memoize, code_version, stable_key
+
+
+def make_square(filename, offset=0):
+    @persistent_memoize(filename)
+    def square(n, power=2):
+        return n ** power + offset
+    return square
+
+
+def test_survives_restart(tmp_path):
+    filename = str(tmp_path / 'cache.sqlite')
+    square = make_square(filename)
+    assert square(3) == 9
+    assert square(3) == 9
+    assert square.disk_misses == 1
+
+    # A new decorator (a restarted process) reads from the disk
+    square = make_square(filename)
+    assert square(3) == 9
+    assert square.disk_hits == 1
+    assert square.disk_misses == 0
+
+
+def test_closure_changes_version(tmp_path):
+    filename = str(tmp_path / 'cache.sqlite')
+    assert make_square(filename, offset=0)(3) == 9
+    square = make_square(filename, offset=1)
+    assert square(3) == 10
+    assert square.disk_misses == 1
+    # The other version's results are kept for processes still using it
+    square = make_square(filename, offset=0)
+    assert square(3) == 9
+    assert square.disk_hits == 1
+
+
+def test_defaults_change_version():
+    def power(n, exponent=2):
+        return n ** exponent
+
+    version = code_version(power)
+    power.__defaults__ = (3,)
+    assert code_version(power) != version
+
+    def keyword(n, *, exponent=2):
+        return n ** exponent
+
+    version = code_version(keyword)
+    keyword.__kwdefaults__ = dict(exponent=3)
+    assert code_version(keyword) != version
+
+
+def test_stable_key():
+    assert stable_key((1, [2]), dict(a={3})) \
+        == stable_key((1, [2]), dict(a={3}))
+    assert stable_key(([1, 2],), {}) != stable_key(((1, 2),), {})
+
+
+def test_version_independent_of_hash_seed():
+    code = '\n'.join([
+        'from persistent import code_version',
+        'def f(x):',
+        '    return x in {"a", "b", "c", "d"}',
+        'print(code_version(f))',
+    ])
+    versions = set()
+    for seed in '123':
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        versions.add(subprocess.check_output(
+            [sys.executable, '-c', code], env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__))))
+    assert len(versions) == 1
@@ -0,0 +1,235 @@
+import time
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from pool import Pool, AsyncPool, PoolTimeout, pooled
+
+
+class FakeConnection:
+
+    def __init__(self, name='fake'):
+        self.name = name
+        self.healthy = True
+        self.closed = False
+
+    def ping(self):
+        return self.healthy
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_max_size():
+    active = []
+    maximum = []
+    lock = threading.Lock()
+    pool = Pool(FakeConnection, min_size=0, max_size=3, timeout=10)
+
+    def worker():
+        with pool.connection() as connection:
+            with lock:
+                active.append(connection)
+                maximum.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(connection)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(maximum) <= 3
+    assert pool.stats().created <= 3
+    assert pool.stats().in_use == 0
+
+
+def test_pool_timeout():
+    pool = Pool(FakeConnection, min_size=1, max_size=1)
+    connection = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    pool.release(connection)
+    assert pool.acquire(timeout=0.05) is connection
+    assert pool.stats().timeouts == 1
+
+
+def test_pool_health_check():
+    pool = Pool(FakeConnection, min_size=1, max_size=1,
+                check=FakeConnection.ping)
+    with pool.connection() as connection:
+        connection.healthy = False
+
+    with pool.connection() as replacement:
+        assert replacement is not connection
+    assert connection.closed
+    assert pool.stats().failed_checks == 1
+
+
+def test_pool_discards_on_error():
+    pool = Pool(FakeConnection, min_size=0, max_size=1)
+    with pytest.raises(ValueError):
+        with pool.connection() as connection:
+            raise ValueError()
+    assert connection.closed
+    assert pool.stats().size == 0
+
+
+def test_pool_idle_eviction():
+    pool = Pool(FakeConnection, min_size=1, max_size=5, idle_timeout=0.05)
+    connections = [pool.acquire() for _ in range(5)]
+    for connection in connections:
+        pool.release(connection)
+    assert pool.stats().idle == 5
+
+    time.sleep(0.1)
+    pool.release(pool.acquire())
+    assert pool.stats().size == 1
+    assert sum(connection.closed for connection in connections) == 4
+
+
+def test_pooled():
+    @pooled(max_size=2)
+    class DatabaseConnection:
+        def __init__(self, connection_string):
+            self.connection_string = connection_string
+
+    pool_1 = DatabaseConnection('db_connection_string_1')
+    pool_2 = DatabaseConnection('db_connection_string_2')
+    assert pool_1 is DatabaseConnection('db_connection_string_1')
+    assert pool_1 is not pool_2
+    with pool_1.connection() as db_1, pool_1.connection() as db_2:
+        assert db_1 is not db_2
+        assert db_1.connection_string == 'db_connection_string_1'
+
+
+def test_pool_sqlite(tmp_path):
+    filename = str(tmp_path / 'test.sqlite')
+
+    def connect():
+        connection = sqlite3.connect(filename, timeout=10,
+                                     check_same_thread=False)
+        connection.execute('CREATE TABLE IF NOT EXISTS numbers (n INTEGER)')
+        return connection
+
+    def check(connection):
+        connection.execute('SELECT 1')
+
+    pool = Pool(connect, min_size=1, max_size=4, check=check)
+
+    def worker(n):
+        with pool.connection() as connection:
+            with connection:
+                connection.execute('INSERT INTO numbers VALUES (?)', (n,))
+
+    threads = [threading.Thread(target=worker, args=(n,))
+               for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with pool.connection() as connection:
+        total, = connection.execute('SELECT SUM(n) FROM numbers').fetchone()
+    assert total == sum(range(20))
+    assert pool.stats().created <= 4
+
+    # A closed connection fails the check and is replaced
+    with pool.connection() as connection:
+        connection.close()
+    with pool.connection() as connection:
+        connection.execute('SELECT 1')
+    pool.close()
+
+
+def test_async_pool():
+    async def connect():
+        await asyncio.sleep(0)
+        return FakeConnection()
+
+    async def check(connection):
+        return connection.ping()
+
+    async def main():
+        active = 0
+        maximum = 0
+
+        async with AsyncPool(connect, min_size=1, max_size=2,
+                             check=check) as pool:
+            async def worker():
+                nonlocal active, maximum
+                async with pool.connection():
+                    active += 1
+                    maximum = max(maximum, active)
+                    await asyncio.sleep(0.01)
+                    active -= 1
+
+            await asyncio.gather(*(worker() for _ in range(10)))
+            assert maximum == 2
+            assert pool.stats().created == 2
+
+            first = await pool.acquire()
+            second = await pool.acquire()
+            with pytest.raises(PoolTimeout):
+                await pool.acquire(timeout=0.05)
+            second.healthy = False
+            await pool.release(first)
+            await pool.release(second)
+            # The most recently released connection is reused first,
+            # it fails the check so the other one is used
+            assert await pool.acquire() is first
+            assert second.closed
+            assert pool.stats().failed_checks == 1
+
+    asyncio.run(main())
+
+
+def test_pool_evicts_on_release():
+    pool = Pool(FakeConnection, min_size=1, max_size=3, idle_timeout=0.05)
+    connections = [pool.acquire() for _ in range(3)]
+    pool.release(connections[0])
+    pool.release(connections[1])
+    time.sleep(0.1)
+    pool.release(connections[2])
+    assert pool.stats().size == 1
+    assert connections[0].closed and connections[1].closed
+
+
+def test_pool_failing_close():
+    def close(connection):
+        raise OSError('close failed')
+
+    pool = Pool(FakeConnection, min_size=0, max_size=2, idle_timeout=0,
+                close=close)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    with pool.connection():
+        pass
+    stats = pool.stats()
+    assert stats.size == stats.idle + stats.in_use
+
+
+def test_async_pool_timeout_while_closing():
+    async def slow_close(connection):
+        await asyncio.sleep(0.2)
+
+    async def main():
+        pool = AsyncPool(FakeConnection, min_size=0, max_size=2,
+                         idle_timeout=0.01, close=slow_close)
+        first = await pool.acquire()
+        second = await pool.acquire()
+        # Release without evicting, so the next acquire closes `first`
+        pool.idle.extend([(first, 0), (second, time.monotonic() + 1)])
+        pool.in_use.clear()
+        with pytest.raises(PoolTimeout):
+            await pool.acquire(timeout=0.05)
+        stats = pool.stats()
+        assert stats.size == stats.idle + stats.in_use
+        assert await pool.acquire(timeout=0.05) is second
+
+    asyncio.run(main())
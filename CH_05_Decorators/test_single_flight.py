@@ -0,0 +1,157 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from caching import MISSING
+from single_flight import cached
+
+
+def test_concurrent_threads_compute_once():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    @cached
+    def slow(n):
+        calls.append(n)
+        started.set()
+        release.wait(5)
+        return n * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow(21)))
+               for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    # Give the other threads time to join the flight
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 20
+    assert calls == [21]
+    assert slow.flight_info().calls == 1
+
+
+def test_leader_checks_the_cache_again():
+    calls = []
+
+    @cached
+    def square(n):
+        calls.append(n)
+        return n * n
+
+    assert square(3) == 9
+    # A caller that missed the cache just before the previous flight
+    # stored its value becomes the next leader
+    get = square.cache.get
+    misses = [MISSING]
+    square.cache.get = lambda key, default=None: \
+        misses.pop() if misses else get(key, default)
+    assert square(3) == 9
+    assert calls == [3]
+
+
+def test_errors_are_shared_and_not_cached():
+    calls = []
+
+    @cached
+    def fail(n):
+        calls.append(n)
+        raise ValueError(n)
+
+    with pytest.raises(ValueError):
+        fail(1)
+    with pytest.raises(ValueError):
+        fail(1)
+    assert calls == [1, 1]
+
+
+def test_stale_while_revalidate():
+    calls = []
+    refreshed = threading.Event()
+
+    @cached(ttl=0.05, stale=10)
+    def version():
+        calls.append(None)
+        if len(calls) > 1:
+            refreshed.set()
+        return len(calls)
+
+    assert version() == 1
+    time.sleep(0.1)
+    # The stale value is returned right away while it's refreshed
+    assert version() == 1
+    assert refreshed.wait(5)
+    # The cache is updated after the function returns
+    deadline = time.monotonic() + 5
+    while version() != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert version() == 2
+    info = version.flight_info()
+    assert info.refreshes == 1
+    assert info.stale >= 1
+
+
+def test_async_concurrent_calls_compute_once():
+    calls = []
+
+    @cached
+    async def fetch(delay):
+        calls.append(delay)
+        await asyncio.sleep(delay)
+        return delay
+
+    async def main():
+        results = await asyncio.gather(*(fetch(0.01) for _ in range(50)))
+        assert results == [0.01] * 50
+        assert await fetch(0.01) == 0.01
+
+    asyncio.run(main())
+    assert calls == [0.01]
+    assert fetch.flight_info().shared == 49
+
+
+def test_async_cancelled_caller_does_not_cancel_the_flight():
+    calls = []
+
+    @cached
+    async def fetch(delay):
+        calls.append(delay)
+        await asyncio.sleep(delay)
+        return delay
+
+    async def main():
+        first = asyncio.ensure_future(fetch(0.05))
+        second = asyncio.ensure_future(fetch(0.05))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == 0.05
+        assert first.cancelled()
+
+    asyncio.run(main())
+    assert calls == [0.05]
+
+
+def test_async_leader_checks_the_cache_again():
+    calls = []
+
+    @cached
+    async def square(n):
+        calls.append(n)
+        return n * n
+
+    async def main():
+        assert await square(3) == 9
+        get = square.cache.get
+        misses = [MISSING]
+        square.cache.get = lambda key, default=None: \
+            misses.pop() if misses else get(key, default)
+        assert await square(3) == 9
+
+    asyncio.run(main())
+    assert calls == [3]
@@ -0,0 +1,119 @@
+'''
+Accumulator coroutines that also accept chunks of numbers.
+
+`running_total` in test_5.py and `destination` in test_4.py resume the
+generator once for every number. The versions below keep that protocol
+but also accept an `array.array` or a NumPy array, which is added in one
+go with a C level `sum`/cumulative sum:
+
+    totaler = running_total()
+    next(totaler)
+    totaler.send(5)                              # 5
+    totaler.send(array.array('l', range(1000)))  # 499505
+
+NumPy is optional, without it only `array.array` chunks are supported.
+Note that NumPy sums in the array dtype (int64 for example) so unlike a
+Python int the total can overflow. The running totals of `array.array`
+chunks are stored as 64-bit integers (`'q'`, or `'Q'` for unsigned
+64-bit chunks) or as doubles (`'d'`) once a float is involved, so only
+totals beyond 2 ** 63 (2 ** 64) overflow, even for chunks of small types
+like `'b'`.
+'''
+import time
+import array
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def chunk_sum(value):
+    '''Sum of a chunk or the value itself for a plain number'''
+    if isinstance(value, array.array):
+        return sum(value)
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return value.sum().item()
+    return value
+
+
+def running_total():
+    '''Send numbers or chunks, every send returns the running total'''
+    total = 0
+    while True:
+        x = yield total
+        if x is None:
+            break
+        total += chunk_sum(x)
+
+
+def running_totals():
+    '''Like `running_total` but a chunk returns the running total after
+    every item of the chunk, as an array of the widest type of the same
+    kind'''
+    total = 0
+    totals = total
+    while True:
+        x = yield totals
+        if x is None:
+            break
+
+        if isinstance(x, array.array):
+            if x.typecode in 'fd' or isinstance(total, float):
+                typecode = 'd'
+            elif x.typecode in 'QL' and total >= 0:
+                # 64-bit unsigned values don't fit in a signed total
+                typecode = 'Q'
+            else:
+                typecode = 'q'
+            totals = array.array(
+                typecode, itertools.accumulate(x, initial=total))
+            del totals[0]
+            total = totals[-1] if totals else total
+        elif numpy is not None and isinstance(x, numpy.ndarray):
+            totals = numpy.cumsum(x) + total
+            total = totals[-1].item() if len(totals) else total
+        else:
+            total += x
+            totals = total
+
+
+def destination():
+    '''The destination of test_4.py, send None to get the total'''
+    total = 0
+    while True:
+        value = yield
+        if value is None:
+            break
+        total += chunk_sum(value)
+    yield total
+
+
+def benchmark(size=1000000, chunk_sizes=(100, 10000)):
+    '''Compare sending every number with sending chunks'''
+    values = array.array('q', range(size))
+    variants = [('per item', values, 1)]
+    for chunk_size in chunk_sizes:
+        chunks = [values[i:i + chunk_size]
+                  for i in range(0, size, chunk_size)]
+        variants.append(('array.array %d' % chunk_size, chunks, chunk_size))
+        if numpy is not None:
+            chunks = [numpy.frombuffer(chunk, dtype=numpy.int64)
+                      for chunk in chunks]
+            variants.append(('numpy %d' % chunk_size, chunks, chunk_size))
+
+    for name, items, chunk_size in variants:
+        totaler = running_total()
+        next(totaler)
+        start = time.perf_counter()
+        send = totaler.send
+        for item in items:
+            total = send(item)
+        duration = time.perf_counter() - start
+        print('%-20s %8.4fs %14.0f values/s total: %d' % (
+            name, duration, size / duration, total))
+
+
+if __name__ == '__main__':
+    benchmark()
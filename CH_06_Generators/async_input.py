@@ -0,0 +1,64 @@
+'''
+Read lines from stdin (or any other file descriptor) without threads.
+
+`asyncio.to_thread(input)` hands every line to the default executor.
+`read_lines` registers the file descriptor with the event loop instead,
+like the `selectors` example in
+CH_07_Multithreading/04_event_loop_implementations.py, and reads as much
+as is available at once so piped input costs one `os.read` per chunk
+instead of a thread hop per line:
+
+    async for line in read_lines():
+        print(line)
+'''
+import os
+import codecs
+import asyncio
+
+
+async def wait_readable(fd):
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    loop.add_reader(fd, readable.set_result, None)
+    try:
+        await readable
+    finally:
+        loop.remove_reader(fd)
+
+
+def read_available(fd, chunk_size):
+    '''Read what is available right now, None if that's nothing. The
+    file descriptor is shared with other processes and with stdout for a
+    terminal, so it is only non-blocking for the duration of the read.'''
+    blocking = os.get_blocking(fd)
+    os.set_blocking(fd, False)
+    try:
+        return os.read(fd, chunk_size)
+    except BlockingIOError:
+        return None
+    finally:
+        os.set_blocking(fd, blocking)
+
+
+async def read_lines(fd=0, chunk_size=2 ** 16, encoding='utf-8'):
+    '''Yield the lines (without the newline) read from `fd` until the
+    end of the file'''
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    while True:
+        data = read_available(fd, chunk_size)
+        if data is None:
+            # Regular files are always readable and never get here,
+            # which is good as epoll refuses to watch them
+            await wait_readable(fd)
+            continue
+
+        lines = (pending + decoder.decode(data, final=not data)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+
+        if not data:
+            if pending:
+                yield pending
+            break
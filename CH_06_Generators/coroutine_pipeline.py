@@ -0,0 +1,289 @@
+'''
+A small push-based dataflow engine made of primed coroutines.
+
+test_4.py and test_5.py wire `source` -> `destination` by hand. Here the
+stages are described first and connected by a `Pipeline`, which ends in
+a sink that collects the results:
+
+    pipeline = Pipeline(
+        map_(lambda x: x * 2),
+        filter_(lambda x: x % 3),
+        window(2),
+    )
+    pipeline.run(range(10))
+    # [(2, 4), (4, 8), (8, 10), (10, 14), (14, 16)]
+
+`broadcast(*branches)` sends every item to several branches (and returns
+the results of every branch), passing several iterables to `run` merges
+them into the pipeline.
+
+Every `send` resumes a generator frame, so a chain of `map_` and
+`filter_` stages (which keep no state) is fused into a single generator
+that applies all of them in one frame. That halves the number of frame
+switches for a map/filter pair on a million item stream.
+'''
+import time
+import functools
+import collections
+
+
+def primed(generator_func):
+    '''Advance new generators to their first `yield`, so they can be
+    sent values right away (also used by test_3.py)'''
+    @functools.wraps(generator_func)
+    def wrapper(*args, **kwargs):
+        generator = generator_func(*args, **kwargs)
+        next(generator)  # Advance to the first `yield` statement
+        return generator
+    return wrapper
+
+
+# -----------------------------------------------------------------------------
+# The coroutines, closing a coroutine closes its target as well so the end
+# of the stream propagates to the sink
+@primed
+def sink(results):
+    while True:
+        results.append((yield))
+
+
+@primed
+def mapper(function, target):
+    send = target.send
+    try:
+        while True:
+            send(function((yield)))
+    finally:
+        target.close()
+
+
+@primed
+def filterer(predicate, target):
+    send = target.send
+    try:
+        while True:
+            item = yield
+            if predicate(item):
+                send(item)
+    finally:
+        target.close()
+
+
+FUSED_TEMPLATE = '''
+def fused(target):
+    send = target.send
+    try:
+        while True:
+            item = yield
+%s
+            send(item)
+    finally:
+        target.close()
+'''
+
+
+def fused(operations, target):
+    '''Apply a chain of map and filter operations in one frame. The
+    generator is generated from source (like `collections.namedtuple`
+    does) so every operation is a plain call in the loop body without
+    any per-item dispatch.'''
+    namespace = dict()
+    body = []
+    for i, (is_filter, function) in enumerate(operations):
+        namespace['f%d' % i] = function
+        if is_filter:
+            body.append('if not f%d(item):' % i)
+            body.append('    continue')
+        else:
+            body.append('item = f%d(item)' % i)
+
+    source = FUSED_TEMPLATE % '\n'.join(' ' * 12 + line for line in body)
+    exec(source, namespace)
+    return primed(namespace['fused'])(target)
+
+
+@primed
+def windower(size, step, target):
+    '''Send sliding windows of `size` items, every `step` items'''
+    send = target.send
+    window = collections.deque(maxlen=size)
+    count = 0
+    try:
+        while True:
+            window.append((yield))
+            count += 1
+            if count >= size and (count - size) % step == 0:
+                send(tuple(window))
+    finally:
+        target.close()
+
+
+@primed
+def broadcaster(targets):
+    sends = [target.send for target in targets]
+    try:
+        while True:
+            item = yield
+            for send in sends:
+                send(item)
+    finally:
+        for target in targets:
+            target.close()
+
+
+def merger(target, inputs):
+    '''Return `inputs` coroutines that all feed `target`, the target is
+    closed once all of them are closed'''
+    remaining = [inputs]
+
+    @primed
+    def entry():
+        send = target.send
+        try:
+            while True:
+                send((yield))
+        finally:
+            remaining[0] -= 1
+            if not remaining[0]:
+                target.close()
+
+    return [entry() for _ in range(inputs)]
+
+
+# -----------------------------------------------------------------------------
+# The stage descriptions
+Stage = collections.namedtuple('Stage', ['kind', 'args'])
+
+STATELESS = {'map', 'filter'}
+
+
+def map_(function):
+    return Stage('map', (function,))
+
+
+def filter_(predicate):
+    return Stage('filter', (predicate,))
+
+
+def window(size, step=1):
+    return Stage('window', (size, step))
+
+
+def broadcast(*branches):
+    '''Send every item to all branches, a branch is a `Pipeline` or a
+    list of stages. This has to be the last stage.'''
+    return Stage('broadcast', branches)
+
+
+class Pipeline:
+
+    def __init__(self, *stages, fuse=True):
+        self.stages = stages
+        self.fuse = fuse
+        for stage in stages[:-1]:
+            if stage.kind == 'broadcast':
+                raise ValueError('broadcast has to be the last stage')
+
+    def compile(self):
+        '''Replace runs of stateless stages by fused stages'''
+        if not self.fuse:
+            return list(self.stages)
+
+        stages = []
+        run = []
+        for stage in self.stages + (None,):
+            if stage is not None and stage.kind in STATELESS:
+                run.append(stage)
+                continue
+
+            if len(run) > 1:
+                stages.append(Stage('fused', tuple(
+                    (run_stage.kind == 'filter', run_stage.args[0])
+                    for run_stage in run)))
+            else:
+                stages.extend(run)
+            run = []
+
+            if stage is not None:
+                stages.append(stage)
+        return stages
+
+    def connect(self):
+        '''Build the coroutines, returns the first coroutine and the list
+        the results end up in (one list per branch for a broadcast)'''
+        stages = self.compile()
+        if stages and stages[-1].kind == 'broadcast':
+            targets = []
+            results = []
+            for branch in stages.pop().args:
+                if not isinstance(branch, Pipeline):
+                    branch = Pipeline(*branch, fuse=self.fuse)
+                branch_target, branch_results = branch.connect()
+                targets.append(branch_target)
+                results.append(branch_results)
+            target = broadcaster(targets)
+        else:
+            results = []
+            target = sink(results)
+
+        for stage in reversed(stages):
+            if stage.kind == 'map':
+                target = mapper(stage.args[0], target)
+            elif stage.kind == 'filter':
+                target = filterer(stage.args[0], target)
+            elif stage.kind == 'fused':
+                target = fused(stage.args, target)
+            elif stage.kind == 'window':
+                target = windower(*stage.args, target)
+        return target, results
+
+    def run(self, *iterables):
+        '''Push the items through the pipeline and return the results.
+        Multiple iterables are merged, taking an item from each in
+        turn.'''
+        target, results = self.connect()
+        if len(iterables) == 1:
+            entries = [target]
+        else:
+            entries = merger(target, len(iterables))
+
+        sources = collections.deque(
+            (iter(iterable), entry.send, entry)
+            for iterable, entry in zip(iterables, entries))
+        while sources:
+            iterator, send, entry = sources.popleft()
+            if len(sources):
+                try:
+                    send(next(iterator))
+                except StopIteration:
+                    entry.close()
+                    continue
+                sources.append((iterator, send, entry))
+            else:
+                # A single source left, no need to alternate anymore
+                for item in iterator:
+                    send(item)
+                entry.close()
+        return results
+
+
+def benchmark(size=1000000, stages=4):
+    '''Compare the fused and unfused pipelines on a chain of map and
+    filter stages'''
+    chain = []
+    for i in range(stages // 2):
+        chain.append(map_(lambda x: x + 1))
+        chain.append(filter_(lambda x: x % 7))
+
+    for fuse in (False, True):
+        pipeline = Pipeline(*chain, fuse=fuse)
+        start = time.perf_counter()
+        results = pipeline.run(range(size))
+        duration = time.perf_counter() - start
+        print('%-8s %d stages: %.3fs, %.0f items/s, %d results' % (
+            'fused' if fuse else 'unfused', stages, duration,
+            size / duration, len(results)))
+
+
+if __name__ == '__main__':
+    benchmark()
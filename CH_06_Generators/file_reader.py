@@ -0,0 +1,113 @@
+'''
+Read many files concurrently without aiofiles and without reading them
+into memory at once.
+
+`read_chunks` reads fixed-size chunks with `os.pread` in a small thread
+pool and yields them in the order they complete. The chunks of a single
+file are read (and yielded) in order, the files are read concurrently.
+At most `max_bytes` worth of chunks is being read or waiting to be
+consumed, and at most `max_files` files are open at the same time, so
+reading thousands of log files uses a constant amount of memory:
+
+    async for chunk in read_chunks(filenames):
+        print(chunk.filename, chunk.offset, len(chunk.data))
+        if chunk.last:
+            print(chunk.filename, 'done')
+'''
+import os
+import asyncio
+import collections
+import concurrent.futures
+
+
+FileChunk = collections.namedtuple(
+    'FileChunk', ['filename', 'offset', 'data', 'last'])
+
+
+class OpenFile:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = None
+        self.offset = 0
+
+    def read(self, chunk_size):
+        '''Read the next chunk, runs in a worker thread'''
+        if self.fd is None:
+            self.fd = os.open(self.filename, os.O_RDONLY)
+        data = os.pread(self.fd, chunk_size, self.offset)
+        chunk = FileChunk(self.filename, self.offset, data,
+                          len(data) < chunk_size)
+        self.offset += len(data)
+        return self, chunk
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+async def read_chunks(filenames, chunk_size=2 ** 16, max_bytes=2 ** 22,
+                      max_files=64, max_workers=8):
+    '''Yield a `FileChunk` for every chunk of every file in completion
+    order. The last chunk of a file has `last` set (and is empty when
+    the file size is a multiple of `chunk_size`).'''
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+    slots = max(1, max_bytes // chunk_size)
+    filenames = iter(filenames)
+    # Open files waiting to have their next chunk read
+    ready = collections.deque()
+    opened = []
+    pending = set()
+    # Reads that are done but not yielded yet
+    completed = collections.deque()
+    try:
+        while True:
+            while len(pending) < slots:
+                if ready:
+                    file = ready.popleft()
+                elif len(opened) < max_files:
+                    filename = next(filenames, None)
+                    if filename is None:
+                        break
+                    file = OpenFile(filename)
+                    opened.append(file)
+                else:
+                    break
+                pending.add(loop.run_in_executor(
+                    executor, file.read, chunk_size))
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            completed.extend(done)
+            while completed:
+                file, chunk = completed.popleft().result()
+                if chunk.last:
+                    file.close()
+                    opened.remove(file)
+                else:
+                    ready.append(file)
+                yield chunk
+    finally:
+        # Reads that haven't started are cancelled, running reads can't
+        # be, wait for them (without blocking the loop) before closing
+        # their files. This also retrieves the errors of the reads that
+        # weren't yielded.
+        executor.shutdown(wait=False, cancel_futures=True)
+        await asyncio.gather(*pending, *completed, return_exceptions=True)
+        for file in opened:
+            file.close()
+
+
+async def read_files(filenames, **kwargs):
+    '''Yield `(filename, content)` for every file as soon as it's read
+    completely, this keeps whole files in memory'''
+    parts = collections.defaultdict(list)
+    async for chunk in read_chunks(filenames, **kwargs):
+        parts[chunk.filename].append(chunk.data)
+        if chunk.last:
+            yield chunk.filename, b''.join(parts.pop(chunk.filename))
@@ -0,0 +1,215 @@
+'''
+Producer/consumer pipelines with bounded queues.
+
+Every `Stage` has its own bounded queue and a number of consumer tasks.
+A consumer takes a batch of up to `batch_size` items (waiting at most
+`batch_timeout` seconds for the batch to fill up), passes it to the
+stage function and puts the results in the queue of the next stage. A
+full queue blocks the stage in front of it, so a slow stage slows the
+whole pipeline down instead of letting the queues grow without limit.
+
+Shutting down doesn't need a sentinel value: closing a stage waits until
+its queue is drained and then cancels its (idle) consumers.
+
+    async def double(batch):
+        return [item * 2 for item in batch]
+
+    async with Pipeline(Stage(double, consumers=4, batch_size=10),
+                        Stage(store, batch_size=100)) as pipeline:
+        await pipeline.feed(range(1000))
+    print(pipeline.stats())
+'''
+import time
+import asyncio
+
+
+class Stage:
+
+    def __init__(self, function, consumers=1, maxsize=100, batch_size=1,
+                 batch_timeout=0.01, name=None):
+        self.function = function
+        self.consumers = consumers
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.name = name or function.__name__
+        self.downstream = None
+        self.queue = None
+        self.tasks = []
+
+        self.items_in = 0
+        self.items_out = 0
+        self.batches = 0
+        # Seconds spent in the stage function and waiting for a full
+        # downstream queue, summed over all consumers
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.started = None
+        self.stopped = None
+
+    def start(self):
+        self.queue = asyncio.Queue(self.maxsize)
+        self.started = time.perf_counter()
+        self.tasks = [asyncio.create_task(self.consume())
+                      for _ in range(self.consumers)]
+
+    async def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            await self.wait_put(item)
+        self.items_in += 1
+
+    async def wait_put(self, item):
+        '''Wait for room in the full queue, unless all consumers crashed
+        and nothing will ever make room'''
+        put = asyncio.ensure_future(self.queue.put(item))
+        try:
+            while not put.done():
+                alive = [task for task in self.tasks if not task.done()]
+                if not alive:
+                    raise self.error()
+                await asyncio.wait(
+                    [put, *alive], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            put.cancel()
+
+    def error(self):
+        '''The error of the first crashed consumer'''
+        for task in self.tasks:
+            if task.done() and not task.cancelled() \
+                    and task.exception() is not None:
+                return task.exception()
+        return RuntimeError('The consumers of %s are stopped' % self.name)
+
+    async def put_many(self, items):
+        for item in items:
+            await self.put(item)
+
+    async def get_batch(self):
+        '''Wait for one item and then add whatever arrives within
+        `batch_timeout` seconds, up to `batch_size` items'''
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(
+                    self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def consume(self):
+        while True:
+            batch = await self.get_batch()
+            try:
+                start = time.perf_counter()
+                results = await self.function(batch)
+                self.busy += time.perf_counter() - start
+                self.batches += 1
+
+                if results is not None:
+                    results = list(results)
+                    self.items_out += len(results)
+                    if self.downstream is not None:
+                        start = time.perf_counter()
+                        await self.downstream.put_many(results)
+                        self.blocked += time.perf_counter() - start
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def close(self):
+        '''Wait until every queued item is processed and stop the
+        consumers. If a consumer crashed its error is raised.'''
+        join = asyncio.ensure_future(self.queue.join())
+        # A crashed consumer finishes before the queue is drained
+        await asyncio.wait(
+            [join, *self.tasks], return_when=asyncio.FIRST_COMPLETED)
+        join.cancel()
+        for task in self.tasks:
+            task.cancel()
+        results = await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.stopped = time.perf_counter()
+        for result in results:
+            if not isinstance(result, asyncio.CancelledError):
+                raise result
+
+    def stats(self):
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        return dict(
+            name=self.name,
+            consumers=self.consumers,
+            items_in=self.items_in,
+            items_out=self.items_out,
+            batches=self.batches,
+            items_per_second=round(self.items_in / elapsed, 1),
+            # Close to 1.0 means the consumers are always busy: this stage
+            # is the bottleneck. A high blocked ratio means the next
+            # stage can't keep up.
+            utilization=round(self.busy / (elapsed * self.consumers), 3),
+            blocked=round(self.blocked / (elapsed * self.consumers), 3),
+        )
+
+
+class Pipeline:
+
+    def __init__(self, *stages):
+        self.stages = stages
+        for stage, downstream in zip(stages, stages[1:]):
+            stage.downstream = downstream
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    async def feed(self, items):
+        '''Put the items (an iterable or async iterable) in the first
+        stage, this blocks while the first queue is full'''
+        first = self.stages[0]
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await first.put(item)
+        else:
+            await first.put_many(items)
+
+    async def close(self):
+        # Closing in order guarantees that nothing is put in a stage
+        # after it's closed
+        try:
+            for stage in self.stages:
+                await stage.close()
+        except BaseException:
+            await self.cancel()
+            raise
+
+    async def cancel(self):
+        '''Stop the consumers of every stage without draining the
+        queues'''
+        tasks = [task for stage in self.stages for task in stage.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.cancel()
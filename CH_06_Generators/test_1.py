@@ -1,10 +1,21 @@
 # python >= 3.10
+import os
 import asyncio
 
+from async_input import read_lines
+
 
 async def echo():
+    # Read stdin through the event loop instead of a thread per line
+    lines = read_lines()
+    interactive = os.isatty(0)
     while True:
-        received = await asyncio.to_thread(input, "Enter a value: ")
+        if interactive:
+            print("Enter a value: ", end="", flush=True)
+        try:
+            received = await lines.__anext__()
+        except StopAsyncIteration:
+            received = 'exit'  # Stop at the end of the input as well
         sent = yield received
         print(f"Received: {sent}")
 
@@ -17,4 +28,4 @@ async def main():
         if value == 'exit':
             break
 
-asyncio.run(main())
\ No newline at end of file
+asyncio.run(main())
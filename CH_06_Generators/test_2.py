@@ -1,5 +1,7 @@
 import asyncio
 
+from pipeline import Pipeline, Stage
+
 
 async def producer(queue):
     for i in range(1, 6):
@@ -21,11 +23,36 @@ async def main():
     producer_task = asyncio.create_task(producer(queue))
     consumer_task = asyncio.create_task(consumer(queue))
 
-    await asyncio.sleep(3)  # Let the producer work for a while
+    await producer_task  # Wait until everything is produced
     await queue.join()  # Wait for all items to be consumed
     await queue.put(None)  # Signal the consumer to exit
 
     # Wait for tasks to finish
     await asyncio.gather(producer_task, consumer_task)
 
-asyncio.run(main())
\ No newline at end of file
+asyncio.run(main())
+
+
+# --------------------------------------------
+# The same with a reusable pipeline: bounded queues, several consumers,
+# batches and no sentinel needed to shut down
+async def produce():
+    for i in range(1, 6):
+        await asyncio.sleep(0.5)  # Simulate slow production
+        yield f"Item {i}"
+
+
+async def consume(batch):
+    for item in batch:
+        print(f"Consumed: {item}")
+
+
+async def pipeline_main():
+    async with Pipeline(
+            Stage(consume, consumers=2, maxsize=10, batch_size=2)
+    ) as pipeline:
+        await pipeline.feed(produce())
+
+    print(pipeline.stats())
+
+asyncio.run(pipeline_main())
@@ -1,31 +1,26 @@
-# import asyncio
+import os
+import asyncio
 
-# async def read_file(file_name):
-#     # need pip install aiofiles
-#     async with aiofiles.open(file_name, mode='r') as file:
-#         content = await file.read()
-#     return content
+from file_reader import read_files
 
-# async def main():
-#     file_names = ["file1.txt", "file2.txt", "file3.txt"]
-#     tasks = [read_file(file_name) for file_name in file_names]
-#     results = await asyncio.gather(*tasks)
-#     for file_name, content in zip(file_names, results):
-#         print(f"Content from {file_name}:\n{content}")
+HERE = os.path.dirname(os.path.abspath(__file__))
 
-# asyncio.run(main()
 
+async def main():
+    # Dependency free instead of aiofiles, the files are read concurrently
+    # in a thread pool and printed in the order they finish
+    file_names = [os.path.join(HERE, name)
+                  for name in ["file1.txt", "file2.txt", "file3.txt"]]
+    async for file_name, content in read_files(file_names):
+        print(f"Content from {os.path.basename(file_name)}:\n"
+              f"{content.decode()}")
 
-import functools
+if __name__ == '__main__':
+    asyncio.run(main())
 
 
-def primed(generator_func):
-    @functools.wraps(generator_func)
-    def wrapper(*args, **kwargs):
-        generator = generator_func(*args, **kwargs)
-        next(generator)  # Advance to the first `yield` statement
-        return generator
-    return wrapper
+# --------------------------------------------
+from coroutine_pipeline import primed
 
 
 # Define a generator function
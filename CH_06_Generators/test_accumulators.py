@@ -0,0 +1,60 @@
+import array
+
+import pytest
+
+from accumulators import running_total, running_totals, destination
+
+
+def start(generator):
+    next(generator)
+    return generator
+
+
+def test_running_total_chunks():
+    totaler = start(running_total())
+    assert totaler.send(5) == 5
+    assert totaler.send(array.array('b', [100] * 10)) == 1005
+    assert totaler.send(array.array('d', [0.5])) == 1005.5
+
+
+def test_running_totals_small_typecode():
+    totaler = start(running_totals())
+    totals = totaler.send(array.array('b', [100] * 5))
+    assert list(totals) == [100, 200, 300, 400, 500]
+
+
+def test_running_totals_mixed_int_and_float():
+    totaler = start(running_totals())
+    assert list(totaler.send(array.array('i', [1, 2]))) == [1, 3]
+    assert list(totaler.send(array.array('f', [0.5]))) == [3.5]
+    totals = totaler.send(array.array('i', [1, 2]))
+    assert totals.typecode == 'd'
+    assert list(totals) == [4.5, 6.5]
+    assert totaler.send(1) == 7.5
+
+
+def test_running_totals_unsigned():
+    totaler = start(running_totals())
+    big = 2 ** 63 + 1
+    totals = totaler.send(array.array('Q', [big, 1]))
+    assert list(totals) == [big, big + 1]
+
+
+def test_destination():
+    sink = start(destination())
+    sink.send(array.array('l', range(10)))
+    sink.send(5)
+    assert sink.send(None) == 50
+
+
+def test_numpy_chunks():
+    numpy = pytest.importorskip('numpy')
+    totaler = start(running_totals())
+    totals = totaler.send(numpy.arange(5))
+    assert totals.tolist() == [0, 1, 3, 6, 10]
+    assert list(totaler.send(array.array('i', [1]))) == [11]
+    assert totaler.send(numpy.array([0.5])).tolist() == [11.5]
+    assert list(totaler.send(array.array('i', [1]))) == [12.5]
+
+    totaler = start(running_total())
+    assert totaler.send(numpy.arange(5)) == 10
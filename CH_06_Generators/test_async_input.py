@@ -0,0 +1,43 @@
+import os
+import asyncio
+
+from async_input import read_lines
+
+
+def test_read_lines():
+    async def main():
+        read_fd, write_fd = os.pipe()
+        loop = asyncio.get_running_loop()
+        data = 'één\ntwee\ndrie'.encode()
+
+        async def write():
+            # One byte at a time, splitting the multi-byte characters
+            for i in range(len(data)):
+                await asyncio.sleep(0)
+                os.write(write_fd, data[i:i + 1])
+            os.close(write_fd)
+
+        writer = loop.create_task(write())
+        lines = [line async for line in read_lines(read_fd, chunk_size=3)]
+        await writer
+        os.close(read_fd)
+        return lines
+
+    assert asyncio.run(main()) == ['één', 'twee', 'drie']
+
+
+def test_read_lines_keeps_blocking_mode():
+    async def main():
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'one\ntwo\n')
+        lines = read_lines(read_fd)
+        assert await lines.__anext__() == 'one'
+        # Blocking while the caller handles a line, even if the
+        # generator is never closed
+        assert os.get_blocking(read_fd)
+        assert await lines.__anext__() == 'two'
+        await lines.aclose()
+        os.close(read_fd)
+        os.close(write_fd)
+
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+import pytest
+
+from coroutine_pipeline import (
+    Pipeline, map_, filter_, window, broadcast, merger, primed)
+
+
+def stages():
+    return [
+        map_(lambda x: x * 2),
+        filter_(lambda x: x % 3),
+        map_(lambda x: x + 1),
+        filter_(lambda x: x % 5),
+        window(2),
+    ]
+
+
+def test_docstring_example():
+    pipeline = Pipeline(
+        map_(lambda x: x * 2),
+        filter_(lambda x: x % 3),
+        window(2),
+    )
+    assert pipeline.run(range(10)) == [
+        (2, 4), (4, 8), (8, 10), (10, 14), (14, 16)]
+
+
+@pytest.mark.parametrize('iterables', [
+    [range(100)],
+    [range(0, 50), range(1000, 1030), []],
+])
+def test_fused_matches_unfused(iterables):
+    fused = Pipeline(*stages())
+    unfused = Pipeline(*stages(), fuse=False)
+    assert [stage.kind for stage in fused.compile()] == ['fused', 'window']
+    assert [stage.kind for stage in unfused.compile()] \
+        == [stage.kind for stage in stages()]
+    assert fused.run(*iterables) == unfused.run(*iterables)
+
+
+def test_single_stage_not_fused():
+    pipeline = Pipeline(filter_(bool), window(2), map_(sum))
+    assert [stage.kind for stage in pipeline.compile()] \
+        == ['filter', 'window', 'map']
+    assert pipeline.run([0, 1, 2, 0, 3]) == [3, 5]
+
+
+def test_window_step():
+    assert Pipeline(window(3, step=2)).run(range(8)) \
+        == [(0, 1, 2), (2, 3, 4), (4, 5, 6)]
+
+
+@pytest.mark.parametrize('fuse', [True, False])
+def test_broadcast(fuse):
+    pipeline = Pipeline(
+        map_(lambda x: x + 1),
+        broadcast(
+            [filter_(lambda x: x % 2), map_(str)],
+            Pipeline(window(2)),
+        ),
+        fuse=fuse,
+    )
+    assert pipeline.run(range(4)) == [['1', '3'], [(1, 2), (2, 3), (3, 4)]]
+
+
+def test_broadcast_is_last():
+    with pytest.raises(ValueError):
+        Pipeline(broadcast([map_(str)]), map_(str))
+
+
+def test_merge_alternates():
+    assert Pipeline().run('ab', 'wxyz', '') == list('awbxyz')
+
+
+def test_merge_closes_once():
+    closed = []
+
+    @primed
+    def last(results):
+        try:
+            while True:
+                results.append((yield))
+        finally:
+            closed.append(True)
+
+    results = []
+    entries = merger(last(results), 3)
+    for i, entry in enumerate(entries):
+        entry.send(i)
+        entry.close()
+        assert closed == ([True] if i == 2 else [])
+    assert results == [0, 1, 2]
@@ -1,35 +1,46 @@
+import time
 import asyncio
 
+from runner import Runner
+from task_profiler import TaskProfiler
+
 
 async def sleeper(delay):
     await asyncio.sleep(delay)
     print('Finished sleeper with delay: %.1f' % delay)
 
 
+async def blocker(delay):
+    time.sleep(delay)  # Blocks the whole loop, the profiler warns about it
+    print('Finished blocker with delay: %.1f' % delay)
+
+
 async def stack_printer():
-    for task in asyncio.Task.all_tasks():
+    for task in asyncio.all_tasks():
         # print(type(task))
         task.print_stack()
 
 
 if __name__ == "__main__":
     '''
-    # Create an event loop
-    loop = asyncio.get_event_loop()
-
-    # Create the task
-    result = loop.call_soon(loop.create_task, sleeper(0.2))
-    # loop.run_forever()``
-
-    # Make sure the loop stops after 1.2 seconds
-    result = loop.call_later(1.2, loop.stop)
-
-    loop.run_forever()
+    # Run the task, the runner stops as soon as it's done instead of
+    # after a fixed 1.2 seconds, the timeout is only an upper bound
+    with Runner(timeout=1.2) as runner:
+        result = runner.run(sleeper(0.2))
     '''
 
     # for debugging purposes
-    # Create an event loop
-    loop = asyncio.get_event_loop()
-
-    # Create the task
-    result = loop.run_until_complete(stack_printer())
\ No newline at end of file
+    with Runner() as runner:
+        # Profile every task created from now on
+        profiler = TaskProfiler(skip=[Runner])
+        profiler.install(runner.loop)
+
+        # Create the tasks
+        result = runner.run(
+            sleeper(0.2),
+            blocker(0.2),
+            stack_printer(),
+        )
+
+        profiler.report()
+        runner.report()
@@ -22,11 +22,21 @@ if __name__ == '__main__':
 
 ##############################################################################
 '''
+import sys
 import asyncio
-import selectors
+
+import loop_backends
 
 
-selector = selectors.SelectSelector()
-loop = asyncio.SelectorEventLoop(selector)
-asyncio.set_event_loop(loop)
+# Instead of hard-wiring selectors.SelectSelector() into an
+# asyncio.SelectorEventLoop the backend is chosen by name: epoll, kqueue,
+# poll, select or uvloop when it is installed. Running this file with
+# `compare` shows the wakeup cost of every backend as the number of idle
+# connections grows.
+if __name__ == '__main__' and sys.argv[1:] == ['compare']:
+    loop_backends.compare()
+else:
+    loop = loop_backends.new_event_loop(
+        sys.argv[1] if len(sys.argv) > 1 else 'select')
+    asyncio.set_event_loop(loop)
 # '''
\ No newline at end of file
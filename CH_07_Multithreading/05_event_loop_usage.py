@@ -28,6 +28,8 @@ loop.run_forever()
 import time
 import asyncio
 
+import loop_backends
+
 
 t = time.time()
 
@@ -37,7 +39,7 @@ async def printer(name):
     print('Finished %s at %.1f' % (name, time.time() - t))
 
 
-loop = asyncio.get_event_loop()
+loop = loop_backends.get_event_loop()
 
 result = loop.call_at(loop.time() + .2, loop.create_task, printer('call_at'))
 result = loop.call_later(.1, loop.create_task, printer('call_later'))
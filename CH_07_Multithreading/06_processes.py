@@ -38,24 +38,75 @@ for process in processes:
 
 # ------------------------------------------------------------------------------
 # '''
+import sys
 import asyncio
-t = time.time()
-
+import subprocess
 
-async def async_process_sleeper():
-    print('Started sleep at %.1f' % (time.time() - t))
-    process = await asyncio.create_subprocess_exec('sleep', '0.3')
-    await process.wait()
-    print('Finished sleep at %.1f' % (time.time() - t))
+import loop_backends
+from process_pool import AsyncProcessPool
+t = time.time()
 
 
-loop = asyncio.get_event_loop()
-for i in range(5):
-    task = loop.create_task(async_process_sleeper())
+async def async_process_sleeper(pool):
+    # The process only starts once the pool has a free slot, so the start
+    # time is derived from the duration of the process itself
+    result = await pool.run('sleep', '0.3')
+    finished = time.time() - t
+    print('Started sleep at %.1f' % (finished - result.duration))
+    print('Finished sleep at %.1f' % finished)
 
-future = loop.call_later(1.5, loop.stop)
 
-loop.run_forever()
+# ------------------------------------------------------------------------------
+# Throughput of the variants above for many short commands. Run this file
+# with `benchmark` as argument to get the report.
+def sequential(commands):
+    for command in commands:
+        subprocess.Popen(command).wait()
+
+
+def fire_and_wait(commands):
+    processes = [subprocess.Popen(command) for command in commands]
+    for process in processes:
+        process.wait()
+
+
+def pooled(commands, concurrency):
+    async def run():
+        pool = AsyncProcessPool(concurrency=concurrency)
+        async for result in pool.map(commands):
+            pass
+
+    loop = loop_backends.get_event_loop()
+    loop.run_until_complete(run())
+    loop.close()
+
+
+def throughput_report(count=500, command=('true',), concurrency=16):
+    commands = [command] * count
+    variants = (
+        ('sequential', sequential, (commands,)),
+        ('fire and wait', fire_and_wait, (commands,)),
+        ('pool (%d)' % concurrency, pooled, (commands, concurrency)),
+    )
+    print('Running %d times %r' % (count, ' '.join(command)))
+    for name, function, args in variants:
+        start = time.perf_counter()
+        function(*args)
+        duration = time.perf_counter() - start
+        print('%-16s %8.3fs %10.1f processes/s'
+              % (name, duration, count / duration))
+
+
+if sys.argv[1:] == ['benchmark']:
+    throughput_report()
+else:
+    # Bounded to 3 processes at a time, the loop finishes as soon as
+    # all sleepers are done instead of at a fixed stop time
+    pool = AsyncProcessPool(concurrency=3)
+    loop = loop_backends.get_event_loop()
+    loop.run_until_complete(asyncio.gather(
+        *(async_process_sleeper(pool) for i in range(5))))
+    loop.close()
 
 
 # ------------------------------------------------------------------------------
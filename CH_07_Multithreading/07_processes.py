@@ -1,25 +1,40 @@
+import os
+import sys
+import time
 import asyncio
 
+from runner import Runner
+from interpreter_pool import InterpreterPool
+from stream_reader import LineReader
 
-async def run_script():
+
+# A simple Python script to evaluate
+SCRIPT = b'\n'.join((
+    b'import math',
+    b'x = 2 ** 8',
+    b'y = math.sqrt(x)',
+    b'z = math.sqrt(y)',
+    b'print("x: %d" % x)',
+    b'print("y: %d" % y)',
+    b'print("z: %d" % z)',
+    b'for i in range(int(z)):',
+    b'    print("i: %d" % i)',
+))
+
+
+async def run_script(script=SCRIPT, verbose=True, line_limit=2 ** 16):
+    # The output goes through a plain pipe so LineReader can read it
+    # into one reusable buffer instead of allocating bytes per line
+    read_fd, write_fd = os.pipe()
     process = await asyncio.create_subprocess_shell(
         'python3',
-        stdout=asyncio.subprocess.PIPE,
+        stdout=write_fd,
         stdin=asyncio.subprocess.PIPE,
     )
+    os.close(write_fd)
 
     # Write a simple Python script to the interpreter
-    process.stdin.write(b'\n'.join((
-        b'import math',
-        b'x = 2 ** 8',
-        b'y = math.sqrt(x)',
-        b'z = math.sqrt(y)',
-        b'print("x: %d" % x)',
-        b'print("y: %d" % y)',
-        b'print("z: %d" % z)',
-        b'for i in range(int(z)):',
-        b'    print("i: %d" % i)',
-    )))
+    process.stdin.write(script)
     # Make sure the stdin is flushed asynchronously
     await process.stdin.drain()
     # And send the end of file so the Python interpreter will
@@ -27,17 +42,59 @@ async def run_script():
     # stall forever.
     process.stdin.write_eof()
 
-    # Fetch the lines from the stdout asynchronously
-    async for out in process.stdout:
-        # Decode the output from bytes and strip the whitespace
-        # (newline) at the right
-        print(out.decode('utf-8').rstrip())
+    # Fetch the lines from the stdout asynchronously, lines longer
+    # than line_limit are split instead of raising an error. Only
+    # decode the output when it's printed.
+    reader = LineReader(read_fd, line_limit=line_limit,
+                        encoding='utf-8' if verbose else None)
+    try:
+        async for out in reader:
+            # Strip the whitespace (newline) at the right
+            if verbose:
+                print(out.rstrip())
+    finally:
+        reader.close()
 
     # Wait for the process to exit
     await process.wait()
 
 
+async def run_script_pooled(pool, script=SCRIPT, verbose=True):
+    # The interpreters in the pool are already running so only the
+    # round trip over the pipes remains
+    async for out in pool.run(script):
+        if verbose:
+            print(out.decode('utf-8'))
+
+
+async def compare(jobs=50, size=4):
+    '''Latency per job of a fresh interpreter versus a warm pool'''
+    start = time.perf_counter()
+    for _ in range(jobs):
+        await run_script(verbose=False)
+    spawned = (time.perf_counter() - start) / jobs
+
+    async with InterpreterPool(size) as pool:
+        start = time.perf_counter()
+        for _ in range(jobs):
+            await run_script_pooled(pool, verbose=False)
+        pooled = (time.perf_counter() - start) / jobs
+
+    print('python3 per script: %8.2fms per job' % (spawned * 1000))
+    print('interpreter pool:   %8.2fms per job' % (pooled * 1000))
+
+
+async def main():
+    await run_script()
+
+    async with InterpreterPool(size=2) as pool:
+        await run_script_pooled(pool)
+
+
 if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(run_script())
-    loop.close()
+    with Runner() as runner:
+        if sys.argv[1:] == ['benchmark']:
+            runner.run(compare())
+        else:
+            runner.run(main())
+        runner.report()
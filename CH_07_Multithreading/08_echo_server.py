@@ -1,6 +1,17 @@
+import os
+import json
+import math
 import time
 import sys
+import signal
 import asyncio
+import argparse
+import functools
+import multiprocessing
+
+import loop_backends
+from runner import Runner
+from task_profiler import TaskProfiler
 
 
 HOST = '127.0.0.1'
@@ -9,6 +20,15 @@ PORT = 1234
 
 start_time = time.time()
 
+# Set by the supervisor in every forked worker so handle_connection
+# can count the connections per worker in shared memory
+worker_index = 0
+connection_counts = None
+
+# The handle_connection tasks that are still running, so a graceful
+# shutdown can wait for them
+active_connections = set()
+
 
 def printer(start_time, *args, **kwargs):
     '''Simple function to print a message prefixed with the
@@ -16,7 +36,113 @@ def printer(start_time, *args, **kwargs):
     print('%.1f' % (time.time() - start_time), *args, **kwargs)
 
 
-async def handle_connection(reader, writer):
+class AsyncLogger:
+    '''Prints messages from a background task so the connection
+    handlers only pay for a `put_nowait`. At most `rate` messages are
+    printed per second, the rest is dropped and counted.'''
+
+    def __init__(self, start_time, rate=100, maxsize=10000):
+        self.start_time = start_time
+        self.rate = rate
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.queue = None
+        self.task = None
+
+    def start(self, loop):
+        self.queue = asyncio.Queue(self.maxsize)
+        self.task = loop.create_task(self.run())
+
+    def log(self, *args, **kwargs):
+        if self.queue is None:
+            printer(self.start_time, *args, **kwargs)
+            return
+
+        try:
+            self.queue.put_nowait((args, kwargs))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # Token bucket which allows bursts of up to `rate` messages
+        tokens = self.rate
+        last = loop.time()
+        while True:
+            args, kwargs = await self.queue.get()
+            now = loop.time()
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            last = now
+            if tokens < 1:
+                self.dropped += 1
+                continue
+
+            tokens -= 1
+            self.report_dropped()
+            printer(self.start_time, *args, **kwargs)
+
+    def report_dropped(self):
+        if self.dropped:
+            printer(self.start_time, 'Dropped %d log messages'
+                    % self.dropped)
+            self.dropped = 0
+
+    async def stop(self):
+        # Flush whatever is left without rate limiting
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+        while not self.queue.empty():
+            args, kwargs = self.queue.get_nowait()
+            printer(self.start_time, *args, **kwargs)
+        self.report_dropped()
+        self.queue = None
+
+
+logger = AsyncLogger(start_time)
+
+
+def make_message(client_address, i, size=0):
+    '''Message number `i` for the client, padded to `size` bytes
+    (including the newline) when the client asked for a fixed size'''
+    message = b'client: %r, %d' % (client_address, i)
+    return message.ljust(size - 1) + b'\n'
+
+
+async def send_batched(writer, messages):
+    '''Collect the messages into a single buffer and only wait for the
+    transport to drain once its high-water mark is reached'''
+    transport = writer.transport
+    high_water = transport.get_write_buffer_limits()[1]
+    buffer = bytearray()
+    for message in messages:
+        buffer += message
+        if len(buffer) >= high_water:
+            writer.write(buffer)
+            buffer = bytearray()
+            if transport.get_write_buffer_size() >= high_water:
+                await writer.drain()
+
+    writer.write(buffer)
+    await writer.drain()
+
+
+async def handle_connection(reader, writer, batch=False):
+    task = asyncio.current_task()
+    active_connections.add(task)
+    if connection_counts is not None:
+        connection_counts[worker_index] += 1
+
+    try:
+        await _handle_connection(reader, writer, batch)
+    finally:
+        active_connections.discard(task)
+
+
+async def _handle_connection(reader, writer, batch):
     client_address = writer.get_extra_info('peername')
     printer(start_time, 'Client connected', client_address)
 
@@ -25,14 +151,24 @@ async def handle_connection(reader, writer):
     writer.write(b'%.2f\n' % start_time)
     await writer.drain()
 
-    repetitions = int((await reader.readline()))
+    # The request is the number of repetitions, optionally followed
+    # by the message size the bench client wants
+    request = (await reader.readline()).split()
+    repetitions = int(request[0])
+    size = int(request[1]) if len(request) > 1 else 0
     printer(start_time, 'Started sending to', client_address)
 
-    for i in range(repetitions):
-        message = 'client: %r, %d\n' % (client_address, i)
-        printer(start_time, message, end='')
-        writer.write(message.encode())
-        await writer.drain()
+    if batch:
+        await send_batched(writer, (
+            make_message(client_address, i, size)
+            for i in range(repetitions)))
+        logger.log('Sent %d lines to' % repetitions, client_address)
+    else:
+        for i in range(repetitions):
+            message = make_message(client_address, i, size)
+            logger.log(message.decode(), end='')
+            writer.write(message)
+            await writer.drain()
 
     printer(start_time, 'Finished sending to', client_address)
     writer.close()
@@ -58,26 +194,279 @@ async def create_connection(repetitions):
     writer.close()
 
 
-if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
+def percentiles(values, *percents):
+    '''Nearest-rank percentiles of `values` in milliseconds'''
+    values = sorted(values)
+    result = dict()
+    for percent in percents:
+        key = 'p%s' % str(percent).replace('.', '')
+        if values:
+            rank = math.ceil(len(values) * percent / 100)
+            index = min(len(values), max(rank, 1)) - 1
+            result[key] = round(values[index] * 1000, 3)
+        else:
+            result[key] = None
+    return result
+
+
+async def bench_connection(repetitions, size, pacing, stats):
+    '''A single bench client, it records how long the connect took and
+    how long it had to wait for every line'''
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(
+        host=HOST, port=PORT, limit=max(2 ** 16, size * 2))
+    stats['connect'].append(time.perf_counter() - started)
+
+    # The server start time, not needed for the benchmark
+    await reader.readline()
+
+    writer.write(b'%d %d\n' % (repetitions, size))
+    await writer.drain()
 
-    if sys.argv[1] == 'server':
-        server = asyncio.start_server(
-            handle_connection,
-            host=HOST,
-            port=PORT,
-        )
-        running_server = loop.run_until_complete(server)
+    while True:
+        waiting = time.perf_counter()
+        line = await reader.readline()
+        if not line:
+            break
 
+        stats['line'].append(time.perf_counter() - waiting)
+        if pacing:
+            # Emulate processing time like create_connection does
+            await asyncio.sleep(pacing)
+
+    writer.close()
+    await writer.wait_closed()
+
+
+async def bench(clients, repetitions, size, pacing):
+    '''Run `clients` concurrent bench connections and summarize the
+    throughput and latency as a dict'''
+    stats = dict(connect=[], line=[])
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        bench_connection(repetitions, size, pacing, stats)
+        for _ in range(clients)), return_exceptions=True)
+    duration = time.perf_counter() - started
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    return dict(
+        clients=clients,
+        repetitions=repetitions,
+        size=size,
+        pacing=pacing,
+        duration=round(duration, 3),
+        errors=len(errors),
+        connections_per_second=round(
+            (clients - len(errors)) / duration, 1),
+        lines_per_second=round(len(stats['line']) / duration, 1),
+        connect_latency_ms=percentiles(stats['connect'], 50, 99, 99.9),
+        line_latency_ms=percentiles(stats['line'], 50, 99, 99.9),
+    )
+
+
+async def serve(grace, reuse_port=False, batch=False, backlog=100,
+                profile=None):
+    '''Run the server until it's cancelled (by the deadline of the
+    runner or SIGINT/SIGTERM). Clients that are still connected get
+    `grace` seconds to finish. With `profile` the tasks are profiled
+    and the stacks are written to that file.'''
+    loop = asyncio.get_running_loop()
+    if profile:
+        profiler = TaskProfiler(skip=[Runner])
+        profiler.install(loop)
+
+    logger.start(loop)
+    server = await asyncio.start_server(
+        functools.partial(handle_connection, batch=batch),
+        host=HOST,
+        port=PORT,
+        reuse_port=reuse_port,
+        backlog=backlog,
+    )
+
+    try:
+        await server.serve_forever()
+    finally:
+        # Stop accepting new clients and let the current ones finish
+        server.close()
+        if active_connections:
+            done, pending = await asyncio.wait(
+                set(active_connections), timeout=grace)
+            for task in pending:
+                task.cancel()
+        await server.wait_closed()
+        await logger.stop()
+
+        if profile:
+            profiler.uninstall()
+            if reuse_port:
+                # Every worker writes its own file
+                profile = '%s.%d' % (profile, worker_index)
+            profiler.dump(profile)
+            profiler.report()
+
+
+def run_server(backend, duration, **serve_options):
+    '''Serve until `duration` seconds have passed (0 runs forever) or
+    SIGINT/SIGTERM is received'''
+    with Runner(backend, handle_signals=True) as runner:
         try:
-            result = loop.call_later(5, loop.stop)
-            loop.run_forever()
-        except KeyboardInterrupt:
+            runner.run(serve(**serve_options), timeout=duration or None)
+        except asyncio.TimeoutError:
             pass
 
-        running_server.close()
-        loop.run_until_complete(running_server.wait_closed())
-    elif sys.argv[1] == 'client':
-        loop.run_until_complete(create_connection(sys.argv[2]))
 
-    loop.close()
+def run_worker(index, counts, backend, **serve_options):
+    '''Entry point of a forked worker, every worker binds the same
+    address through SO_REUSEPORT so the kernel balances the incoming
+    connections between them'''
+    global worker_index, connection_counts
+    worker_index = index
+    connection_counts = counts
+
+    try:
+        run_server(backend, reuse_port=True, **serve_options)
+    except BaseException:
+        # Never fall through to the supervisor code in the child
+        import traceback
+        traceback.print_exc()
+        sys.stdout.flush()
+        os._exit(1)
+
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def supervise(workers, report_interval, backend, **serve_options):
+    '''Fork `workers` server processes and restart the ones that
+    crash until SIGINT/SIGTERM is received'''
+    # Shared memory is created before forking so every worker writes
+    # into the same array
+    counts = multiprocessing.Array('Q', workers, lock=False)
+    children = dict()
+    stopping = False
+
+    def spawn(index):
+        # Flush before forking so buffered output isn't printed twice
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            run_worker(index, counts, backend, **serve_options)
+        children[pid] = index
+        printer(start_time, 'Started worker %d with pid %d' % (index, pid))
+
+    def report(*args):
+        for index, count in enumerate(counts):
+            printer(start_time, 'Worker %d handled %d connections'
+                    % (index, count))
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    for index in range(workers):
+        spawn(index)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    if report_interval:
+        signal.signal(signal.SIGALRM, report)
+        signal.setitimer(
+            signal.ITIMER_REAL, report_interval, report_interval)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        index = children.pop(pid)
+        if status and not stopping:
+            printer(start_time, 'Worker %d (pid %d) died with status %d, '
+                    'restarting' % (index, pid, status))
+            spawn(index)
+
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    report()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    loop_backends.add_argument(parser)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    server = subparsers.add_parser('server')
+    server.add_argument(
+        '--workers', type=int, default=1,
+        help='number of server processes sharing the port')
+    server.add_argument(
+        '--duration', type=float, default=5,
+        help='stop after this many seconds, 0 to run until interrupted')
+    server.add_argument(
+        '--grace', type=float, default=5,
+        help='seconds connected clients get to finish on shutdown')
+    server.add_argument(
+        '--report-interval', type=float, default=0,
+        help='print the per-worker connection counts every N seconds')
+    server.add_argument(
+        '--batch', action='store_true',
+        help='send all lines in one buffer instead of one write per line')
+    server.add_argument(
+        '--log-rate', type=float, default=100,
+        help='maximum number of per-line log messages per second')
+    server.add_argument(
+        '--backlog', type=int, default=100,
+        help='listen backlog, raise it when benchmarking many clients')
+    server.add_argument(
+        '--profile', metavar='FILENAME',
+        help='profile the tasks and write the time per await stack to '
+        'this file in the collapsed (flame graph) format')
+
+    client = subparsers.add_parser('client')
+    client.add_argument('repetitions')
+
+    bench = subparsers.add_parser('bench')
+    bench.add_argument(
+        '--clients', type=int, default=1000,
+        help='number of concurrent client connections')
+    bench.add_argument(
+        '--repetitions', type=int, default=10,
+        help='number of lines every client requests')
+    bench.add_argument(
+        '--size', type=int, default=0,
+        help='pad every line to this many bytes')
+    bench.add_argument(
+        '--pacing', type=float, default=0,
+        help='seconds every client sleeps after receiving a line')
+    bench.add_argument(
+        '--output', type=argparse.FileType('w'), default=sys.stdout,
+        help='write the JSON report to this file')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+
+    if args.command == 'server':
+        logger.rate = args.log_rate
+        serve_options = dict(duration=args.duration, grace=args.grace,
+                             batch=args.batch, backlog=args.backlog,
+                             profile=args.profile)
+        if args.workers > 1:
+            supervise(args.workers, args.report_interval, args.loop,
+                      **serve_options)
+        else:
+            run_server(args.loop, **serve_options)
+    else:
+        with Runner(args.loop) as runner:
+            if args.command == 'client':
+                runner.run(create_connection(args.repetitions))
+            elif args.command == 'bench':
+                loop_backends.raise_open_files_limit(args.clients + 100)
+                report, = runner.run(bench(
+                    args.clients, args.repetitions, args.size, args.pacing))
+                json.dump(report, args.output, indent=4)
+                args.output.write('\n')
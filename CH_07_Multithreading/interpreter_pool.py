@@ -0,0 +1,207 @@
+'''
+A warm pool of long-lived Python interpreters.
+
+`run_script` in 07_processes.py starts a fresh `python3` for every
+script, so every job pays the interpreter startup time. The workers in
+this pool stay alive and receive their scripts over stdin, the output
+is streamed back line by line:
+
+    pool = InterpreterPool(size=4)
+    await pool.start()
+    async for line in pool.run(b'print("spam")'):
+        print(line)
+    await pool.close()
+
+Every message is a frame made of a one byte type, a four byte big
+endian length and the payload. The parent sends `S` (script) frames,
+the worker answers with `O` (output line) frames followed by one `E`
+(end) frame whose payload is the formatted traceback if the script
+failed. Because the parent only reads the next frame when the consumer
+asks for the next line a slow consumer fills the pipe, which blocks the
+worker: back-pressure comes for free.
+
+The scripts run in a fresh namespace but share the interpreter, so
+modules they import stay imported for the next script.
+'''
+import io
+import sys
+import struct
+import asyncio
+import traceback
+
+
+HEADER = struct.Struct('>cI')
+
+SCRIPT = b'S'
+OUTPUT = b'O'
+END = b'E'
+
+
+class ScriptError(Exception):
+    '''The script raised an exception, the argument is the traceback
+    formatted by the worker'''
+
+
+def write_frame(stream, type_, payload=b''):
+    stream.write(HEADER.pack(type_, len(payload)) + payload)
+
+
+class FrameWriter(io.TextIOBase):
+    '''Replaces `sys.stdout` in the worker and sends every complete line
+    as an output frame'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = ''
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        lines = (self.pending + data).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            write_frame(self.stream, OUTPUT, line.encode('utf-8'))
+        return len(data)
+
+    def flush(self):
+        if self.pending:
+            write_frame(self.stream, OUTPUT, self.pending.encode('utf-8'))
+            self.pending = ''
+        self.stream.flush()
+
+
+def worker():
+    '''Main loop of a worker process, it executes scripts until stdin is
+    closed'''
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+
+    while True:
+        header = stdin.read(HEADER.size)
+        if len(header) < HEADER.size:
+            break
+
+        type_, size = HEADER.unpack(header)
+        script = stdin.read(size)
+
+        error = b''
+        sys.stdout = FrameWriter(stdout)
+        # Scripts must not read the protocol frames from stdin
+        sys.stdin = io.StringIO()
+        try:
+            code = compile(script, '<script>', 'exec')
+            exec(code, dict(__name__='__main__'))
+        except BaseException:
+            error = traceback.format_exc().encode('utf-8')
+        finally:
+            sys.stdout.flush()
+            sys.stdout = sys.__stdout__
+            sys.stdin = sys.__stdin__
+
+        write_frame(stdout, END, error)
+        stdout.flush()
+
+
+class InterpreterWorker:
+
+    def __init__(self):
+        self.process = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, __file__, '--worker',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+
+    async def read_frame(self):
+        header = await self.process.stdout.readexactly(HEADER.size)
+        type_, size = HEADER.unpack(header)
+        return type_, await self.process.stdout.readexactly(size)
+
+    async def run(self, script):
+        '''Send the script and yield its output lines as bytes'''
+        write_frame(self.process.stdin, SCRIPT, script)
+        await self.process.stdin.drain()
+
+        while True:
+            type_, payload = await self.read_frame()
+            if type_ == OUTPUT:
+                yield payload
+            elif payload:
+                raise ScriptError(payload.decode('utf-8'))
+            else:
+                break
+
+    async def close(self):
+        if self.process.returncode is None:
+            self.process.stdin.close()
+            try:
+                await asyncio.wait_for(self.process.wait(), 1)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+
+class InterpreterPool:
+
+    def __init__(self, size=4):
+        self.size = size
+        self.idle = None
+        self.workers = set()
+
+    async def start(self):
+        self.idle = asyncio.Queue()
+        await asyncio.gather(*(self.spawn() for _ in range(self.size)))
+
+    async def spawn(self):
+        worker = InterpreterWorker()
+        await worker.start()
+        self.workers.add(worker)
+        self.idle.put_nowait(worker)
+
+    async def run(self, script):
+        '''Run the script on the next idle worker and yield its output
+        lines. If the consumer stops early the worker is in the middle
+        of a script, so it's replaced by a fresh one.'''
+        worker = await self.idle.get()
+        finished = False
+        try:
+            async for line in worker.run(script):
+                yield line
+            finished = True
+        except ScriptError:
+            finished = True
+            raise
+        finally:
+            if finished:
+                self.idle.put_nowait(worker)
+            else:
+                self.workers.discard(worker)
+                worker.kill()
+                await worker.process.wait()
+                await self.spawn()
+
+    async def run_lines(self, script):
+        '''Convenience wrapper which collects all output lines'''
+        return [line async for line in self.run(script)]
+
+    async def close(self):
+        await asyncio.gather(*(worker.close() for worker in self.workers))
+        self.workers.clear()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+if __name__ == '__main__' and sys.argv[1:] == ['--worker']:
+    worker()
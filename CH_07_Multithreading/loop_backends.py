@@ -0,0 +1,171 @@
+'''
+Pluggable event loop backends for the CH_07 scripts.
+
+`asyncio` uses the best selector available by default, but it can be
+useful to pick one explicitly: `select()` is O(n) per wakeup and is
+limited to 1024 file descriptors while `epoll` (Linux), `kqueue` (BSD
+and OS X) and `uvloop` (if installed) scale with the number of active
+connections instead.
+
+The scripts use the backend from the `LOOP_BACKEND` environment
+variable, the echo server has a `--loop` option as well:
+
+    LOOP_BACKEND=poll python3 02_singlethread.py
+    python3 08_echo_server.py server --loop epoll
+
+Running this module compares the wakeup cost of the backends as the
+number of idle connections grows:
+
+    python3 loop_backends.py
+'''
+import os
+import sys
+import time
+import socket
+import asyncio
+import resource
+import selectors
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+SELECTORS = dict(
+    epoll=getattr(selectors, 'EpollSelector', None),
+    kqueue=getattr(selectors, 'KqueueSelector', None),
+    devpoll=getattr(selectors, 'DevpollSelector', None),
+    poll=getattr(selectors, 'PollSelector', None),
+    select=selectors.SelectSelector,
+)
+
+ENVIRONMENT_VARIABLE = 'LOOP_BACKEND'
+
+
+def available_backends():
+    '''The backends that can be used on this platform'''
+    backends = [name for name, selector in SELECTORS.items() if selector]
+    if uvloop is not None:
+        backends.append('uvloop')
+    return backends
+
+
+def new_event_loop(backend='default'):
+    '''Create a new event loop for the given backend name, `default`
+    lets asyncio decide'''
+    if backend == 'default':
+        return asyncio.new_event_loop()
+    elif backend == 'uvloop':
+        if uvloop is None:
+            raise ValueError('uvloop is not installed')
+        return uvloop.new_event_loop()
+    elif SELECTORS.get(backend) is None:
+        raise ValueError('Unsupported event loop backend %r, choose from: '
+                         '%s' % (backend, ', '.join(available_backends())))
+    else:
+        return asyncio.SelectorEventLoop(SELECTORS[backend]())
+
+
+def get_event_loop(backend=None):
+    '''Create an event loop for `backend` (or the `LOOP_BACKEND`
+    environment variable) and make it the current event loop'''
+    if backend is None:
+        backend = os.environ.get(ENVIRONMENT_VARIABLE, 'default')
+
+    loop = new_event_loop(backend)
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def add_argument(parser):
+    parser.add_argument(
+        '--loop', default=os.environ.get(ENVIRONMENT_VARIABLE, 'default'),
+        choices=['default'] + available_backends(),
+        help='event loop backend to use')
+
+
+def raise_open_files_limit(required):
+    '''Thousands of connections need more file descriptors than the
+    usual soft limit of 1024 so raise it as far as the hard limit
+    allows'''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= required:
+        return
+    if hard != resource.RLIM_INFINITY:
+        required = min(required, hard)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (required, hard))
+
+
+async def ping(rounds):
+    '''Send a byte through a socket pair `rounds` times and wait for
+    the loop to report it as readable, returns the seconds per wakeup'''
+    loop = asyncio.get_running_loop()
+    receiver, sender = socket.socketpair()
+    receiver.setblocking(False)
+    waiter = None
+
+    def readable():
+        receiver.recv(1)
+        waiter.set_result(None)
+
+    loop.add_reader(receiver.fileno(), readable)
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            waiter = loop.create_future()
+            sender.send(b'x')
+            await waiter
+        return (time.perf_counter() - start) / rounds
+    finally:
+        loop.remove_reader(receiver.fileno())
+        receiver.close()
+        sender.close()
+
+
+def measure_wakeup(backend, idle, rounds=2000):
+    '''Seconds per wakeup with `idle` registered connections that never
+    become readable'''
+    loop = new_event_loop(backend)
+    pairs = []
+    try:
+        for _ in range(idle):
+            pair = socket.socketpair()
+            pairs.append(pair)
+            loop.add_reader(pair[0].fileno(), lambda: None)
+
+        coroutine = ping(rounds)
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            # Avoid a "never awaited" warning when select() gives up
+            coroutine.close()
+    finally:
+        for a, b in pairs:
+            loop.remove_reader(a.fileno())
+            a.close()
+            b.close()
+        loop.close()
+
+
+def compare(idle_counts=(0, 100, 500, 1000, 5000), rounds=2000):
+    '''Print the wakeup cost in microseconds for every backend'''
+    raise_open_files_limit(max(idle_counts) * 2 + 100)
+    backends = available_backends()
+
+    print('%-8s' % 'idle' + ''.join('%12s' % name for name in backends))
+    for idle in idle_counts:
+        row = ['%-8d' % idle]
+        for backend in backends:
+            try:
+                cost = measure_wakeup(backend, idle, rounds)
+                row.append('%10.1fus' % (cost * 1e6))
+            except (ValueError, OSError):
+                # select() can't handle file descriptors above 1024
+                row.append('%12s' % 'n/a')
+        print(''.join(row))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    compare()
@@ -0,0 +1,101 @@
+'''
+A pool for running many short external commands with asyncio.
+
+Creating a task per subprocess (like `async_process_sleeper` in
+06_processes.py) starts every process at once. The pool limits the
+number of processes running at the same time, yields the results in
+the order the processes finish and kills processes that time out or
+whose caller is cancelled:
+
+    pool = AsyncProcessPool(concurrency=8, timeout=10)
+    async for result in pool.map([('sleep', '0.3')] * 100):
+        print(result.args, result.returncode)
+'''
+import os
+import time
+import asyncio
+import collections
+
+
+ProcessResult = collections.namedtuple(
+    'ProcessResult',
+    ['args', 'returncode', 'stdout', 'stderr', 'duration', 'timed_out'],
+)
+
+
+class AsyncProcessPool:
+
+    def __init__(self, concurrency=None, timeout=None, capture_output=False):
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.timeout = timeout
+        self.capture_output = capture_output
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def run(self, *args, timeout=None, input=None):
+        '''Run a single command once a slot is available. A timed out
+        process is killed and reported with `timed_out` set, when the
+        caller is cancelled the process is killed as well'''
+        if timeout is None:
+            timeout = self.timeout
+
+        pipe = asyncio.subprocess.PIPE if self.capture_output else None
+        async with self.semaphore:
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=None if input is None else asyncio.subprocess.PIPE,
+                stdout=pipe,
+                stderr=pipe,
+            )
+            timed_out = False
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(input), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                stdout = stderr = None
+                await self._kill(process)
+            except asyncio.CancelledError:
+                await self._kill(process)
+                raise
+
+            return ProcessResult(args, process.returncode, stdout, stderr,
+                                 time.perf_counter() - start, timed_out)
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        # Reap the process so it doesn't linger as a zombie
+        await process.wait()
+
+    async def map(self, commands, timeout=None):
+        '''Run all commands and yield the results in completion order.
+        Only `concurrency` tasks exist at any time so thousands of
+        commands don't create thousands of pending tasks. Closing the
+        generator early cancels (and kills) the running processes.'''
+        commands = iter(commands)
+        pending = set()
+        try:
+            while True:
+                for args in commands:
+                    pending.add(asyncio.ensure_future(
+                        self.run(*args, timeout=timeout)))
+                    if len(pending) >= self.concurrency:
+                        break
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
@@ -0,0 +1,212 @@
+'''
+Run coroutines with structured concurrency instead of
+`get_event_loop()`, `run_until_complete` and `call_later(n, loop.stop)`.
+
+All coroutines passed to `Runner.run` run as tasks of one `TaskGroup`.
+The run ends as soon as all of them are done, when one of them fails
+(the others are cancelled and the first error is raised), or when the
+deadline passes (everything is cancelled and `asyncio.TimeoutError` is
+raised). Tasks that are still left on the loop after that are cancelled
+and awaited before `run` returns, so nothing keeps running in the
+background:
+
+    with Runner(timeout=1) as runner:
+        results = runner.run(sleeper(0.3), sleeper(0.5))
+        runner.report()  # wall: 0.501s, cpu: 0.002s (0%), 2 tasks
+
+The loop comes from `loop_backends` so the `LOOP_BACKEND` environment
+variable still works.
+'''
+import time
+import signal
+import asyncio
+import collections
+
+import loop_backends
+
+
+RunStats = collections.namedtuple(
+    'RunStats', ['wall', 'cpu', 'tasks', 'leftover', 'timed_out', 'signal'])
+
+
+class TaskGroup:
+    '''Like `asyncio.TaskGroup` (Python 3.11) but it works on Python 3.10
+    as well and raises the first error instead of an `ExceptionGroup`'''
+
+    def __init__(self):
+        self.tasks = set()
+        self.created = 0
+        self.error = None
+        self.parent = None
+        self.exiting = False
+
+    async def __aenter__(self):
+        self.parent = asyncio.current_task()
+        return self
+
+    def create_task(self, coroutine, name=None):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        if name is not None:
+            task.set_name(name)
+        self.tasks.add(task)
+        self.created += 1
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+
+        if self.error is None:
+            self.error = task.exception()
+            self.cancel()
+            if not self.exiting:
+                # Interrupt the body of the `async with` as well
+                self.parent.cancel()
+
+    def cancel(self):
+        '''Cancel all tasks, the group exits once they are done'''
+        for task in self.tasks:
+            task.cancel()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.exiting = True
+        cancelled = False
+        if exc_value is not None:
+            if exc_type is asyncio.CancelledError:
+                cancelled = self.error is None
+            self.cancel()
+
+        while self.tasks:
+            try:
+                await asyncio.wait(set(self.tasks))
+            except asyncio.CancelledError:
+                cancelled = True
+                self.cancel()
+
+        if self.error is not None:
+            raise self.error
+        if cancelled:
+            raise asyncio.CancelledError()
+
+
+class Runner:
+
+    def __init__(self, backend=None, timeout=None, handle_signals=False):
+        self.loop = loop_backends.get_event_loop(backend)
+        self.timeout = timeout
+        self.handle_signals = handle_signals
+        self.group = None
+        self.stats = None
+        self.timed_out = False
+        self.signal = None
+
+    def run(self, *coroutines, timeout=None):
+        '''Run the coroutines concurrently and return their results, the
+        results of tasks cancelled by a signal are None'''
+        if timeout is None:
+            timeout = self.timeout
+        self.timed_out = False
+        self.signal = None
+        self.group = None
+
+        if self.handle_signals:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self.loop.add_signal_handler(signum, self.stop, signum)
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            return self.loop.run_until_complete(
+                self.main(coroutines, timeout))
+        finally:
+            leftover = self.cancel_leftover()
+            if self.handle_signals:
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    self.loop.remove_signal_handler(signum)
+            self.stats = RunStats(
+                wall=time.perf_counter() - wall,
+                cpu=time.process_time() - cpu,
+                tasks=self.group.created if self.group else 0,
+                leftover=leftover,
+                timed_out=self.timed_out,
+                signal=self.signal,
+            )
+
+    async def main(self, coroutines, timeout):
+        handle = None
+        if timeout is not None:
+            handle = self.loop.call_later(timeout, self.expire)
+
+        try:
+            async with TaskGroup() as self.group:
+                tasks = [self.group.create_task(coroutine)
+                         for coroutine in coroutines]
+                if self.signal is not None:
+                    # The signal arrived before the group existed
+                    self.group.cancel()
+        finally:
+            if handle is not None:
+                handle.cancel()
+
+        if self.timed_out:
+            raise asyncio.TimeoutError(
+                'Deadline of %.3f seconds exceeded' % timeout)
+        return [None if task.cancelled() else task.result()
+                for task in tasks]
+
+    def expire(self):
+        self.timed_out = True
+        self.group.cancel()
+
+    def stop(self, signum):
+        self.signal = signum
+        if self.group is not None:
+            self.group.cancel()
+
+    def cancel_leftover(self):
+        '''Cancel and wait for the tasks that outlived the run, like
+        `asyncio.run` does'''
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        results = self.loop.run_until_complete(
+            asyncio.gather(*tasks, return_exceptions=True))
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                self.loop.call_exception_handler(dict(
+                    message='Unhandled exception in leftover task',
+                    exception=result,
+                    task=task,
+                ))
+        return len(tasks)
+
+    def report(self):
+        stats = self.stats
+        print('wall: %.3fs, cpu: %.3fs (%.0f%%), %d tasks' % (
+            stats.wall, stats.cpu, stats.cpu / stats.wall * 100,
+            stats.tasks), end='')
+        if stats.leftover:
+            print(', %d leftover tasks cancelled' % stats.leftover, end='')
+        if stats.timed_out:
+            print(', deadline exceeded', end='')
+        print()
+
+    def close(self):
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.run_until_complete(self.loop.shutdown_default_executor())
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def run(*coroutines, timeout=None, backend=None):
+    '''Run the coroutines with a new `Runner` and return their results'''
+    with Runner(backend, timeout) as runner:
+        return runner.run(*coroutines)
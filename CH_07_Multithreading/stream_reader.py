@@ -0,0 +1,201 @@
+'''
+Bounded, zero-copy line reading for subprocess output.
+
+`async for out in process.stdout` allocates a new bytes object for every
+line and a single very long line can exceed the StreamReader limit. The
+`LineReader` reads straight from a file descriptor into one reusable
+buffer (`os.readv`) and hands out memoryviews of that buffer:
+
+    read_fd, write_fd = os.pipe()
+    process = await asyncio.create_subprocess_exec(
+        'python3', 'chatty.py', stdout=write_fd)
+    os.close(write_fd)
+
+    async for line in LineReader(read_fd):
+        ...
+
+A memoryview is only valid until the next line is requested, copy it
+with `bytes(line)` to keep it. Lines longer than `line_limit` are split
+in pieces of at most `line_limit` bytes (or truncated with
+`overflow='truncate'`) so the memory use stays bounded. With an
+`encoding` the lines are decoded incrementally, which keeps multi-byte
+characters intact when a long line is split.
+
+`FanOut` copies every line once and hands it to several async
+consumers through bounded queues, so the slowest consumer sets the pace.
+A consumer that stops iterating early is unsubscribed once its iterator
+is closed (`aclose`, or garbage collected).
+'''
+import os
+import codecs
+import asyncio
+
+
+class LineReader:
+
+    def __init__(self, fd, buffer_size=2 ** 16, line_limit=None,
+                 encoding=None, errors='strict', overflow='split'):
+        if line_limit is None:
+            line_limit = buffer_size
+        if line_limit > buffer_size:
+            raise ValueError('line_limit can not exceed the buffer_size')
+        if overflow not in ('split', 'truncate'):
+            raise ValueError('overflow must be "split" or "truncate"')
+
+        self.fd = fd
+        self.line_limit = line_limit
+        self.overflow = overflow
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.eof = False
+        # Set after truncating a line, the rest of it is skipped
+        self.skipping = False
+        self.decoder = None
+        if encoding:
+            self.decoder = codecs.getincrementaldecoder(encoding)(errors)
+        os.set_blocking(fd, False)
+
+    async def fill(self):
+        '''Move the unread data to the front of the buffer and read as
+        much as fits behind it'''
+        if self.start:
+            size = self.end - self.start
+            self.buffer[:size] = self.view[self.start:self.end]
+            self.start, self.end = 0, size
+
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                size = os.readv(self.fd, [self.view[self.end:]])
+            except BlockingIOError:
+                # Register the descriptor with the loop and wait until
+                # it's readable, like the selectors example in
+                # 04_event_loop_implementations.py
+                readable = loop.create_future()
+                loop.add_reader(self.fd, readable.set_result, None)
+                try:
+                    await readable
+                finally:
+                    loop.remove_reader(self.fd)
+            else:
+                break
+
+        if size:
+            self.end += size
+        else:
+            self.eof = True
+
+    async def readline(self):
+        '''Return the next line (including the newline) as memoryview,
+        an empty memoryview at the end of the stream'''
+        while True:
+            newline = self.buffer.find(b'\n', self.start, self.end)
+            if self.skipping:
+                if newline == -1:
+                    self.start = self.end
+                else:
+                    self.start = newline + 1
+                    self.skipping = False
+                    continue
+            elif newline != -1 and newline - self.start < self.line_limit:
+                line = self.view[self.start:newline + 1]
+                self.start = newline + 1
+                return line
+            elif self.end - self.start >= self.line_limit:
+                line = self.view[self.start:self.start + self.line_limit]
+                self.start += self.line_limit
+                self.skipping = self.overflow == 'truncate'
+                return line
+
+            if self.eof:
+                line = self.view[self.start:self.end]
+                self.start = self.end
+                return line
+
+            await self.fill()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self.readline()
+        if self.decoder is None:
+            if not line:
+                raise StopAsyncIteration
+            return line
+
+        if not line:
+            # Raises if the stream ended in the middle of a character
+            self.decoder.decode(b'', final=True)
+            raise StopAsyncIteration
+        text = self.decoder.decode(line)
+        if self.skipping:
+            # The line was truncated, possibly in the middle of a
+            # character that must not be glued to the next line
+            self.decoder.reset()
+        return text
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FanOut:
+    '''Distribute the lines of a reader to several consumers'''
+
+    # Marks the end of the stream in the consumer queues
+    _EOF = object()
+
+    def __init__(self, reader, maxsize=100):
+        self.reader = reader
+        self.maxsize = maxsize
+        self.queues = []
+
+    def subscribe(self):
+        '''Return an async iterator over the lines, subscribe all
+        consumers before calling `run`'''
+        queue = asyncio.Queue(self.maxsize)
+        self.queues.append(queue)
+        return self._consume(queue)
+
+    async def _consume(self, queue):
+        try:
+            while True:
+                line = await queue.get()
+                if line is self._EOF:
+                    break
+                yield line
+        finally:
+            # A consumer that stopped early (or was closed) doesn't get
+            # any more lines, emptying its queue wakes up a blocked `run`
+            self.queues.remove(queue)
+            while not queue.empty():
+                queue.get_nowait()
+
+    def stop_consumers(self):
+        '''Drop the lines the consumers didn't get yet and end their
+        streams, without waiting for them'''
+        for queue in self.queues:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self._EOF)
+
+    async def run(self):
+        '''Read the lines and put them in every queue, a full queue
+        blocks the reader until its consumer catches up. When reading
+        fails (or `run` is cancelled) the consumers are stopped right
+        away.'''
+        try:
+            async for line in self.reader:
+                if isinstance(line, memoryview):
+                    # The buffer is reused so every line is copied once
+                    line = bytes(line)
+                for queue in list(self.queues):
+                    await queue.put(line)
+        except BaseException:
+            self.stop_consumers()
+            raise
+
+        for queue in list(self.queues):
+            await queue.put(self._EOF)
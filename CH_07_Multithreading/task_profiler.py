@@ -0,0 +1,264 @@
+'''
+Find out which coroutines keep the event loop busy.
+
+The profiler installs a task factory that wraps the coroutine of every
+new task, so every step of the task (the code between two `await`s that
+actually suspend) is timed. The wrapper also adds a callback to every
+future the task awaits, which splits the time a task isn't running
+into:
+
+- waiting: until the loop runs the callbacks of the future it awaits
+- scheduled: ready to run, but waiting for its turn in the loop (a task
+  that yields with `asyncio.sleep(0)` is ready immediately)
+
+Nothing of the loop itself is patched, so this works with any loop that
+supports task factories (uvloop too).
+
+Steps that block the loop for more than `slow_callback` seconds are
+logged, and the time per await stack can be written in the collapsed
+stack format that flamegraph.pl and speedscope read:
+
+    profiler = TaskProfiler()
+    profiler.install(loop)
+    loop.run_until_complete(main())
+    profiler.report()
+    profiler.dump('profile.folded')
+
+Only tasks created after `install` are profiled.
+'''
+import os
+import sys
+import time
+import asyncio
+import inspect
+import logging
+import collections
+
+
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+CREATE_TASK = {'create_task', 'ensure_future', '_ensure_future'}
+
+logger = logging.getLogger(__name__)
+
+
+def creation_site(skip=frozenset()):
+    '''The first frame outside of asyncio, the profiler and the files in
+    `skip`, which is the code that created the task. Tasks created by a
+    loop callback (like the protocol of a server) get the asyncio frame
+    that created them instead, except when that frame is in one of the
+    `skip` files (like the tasks of `runner.Runner`), those get the code
+    that started the loop.'''
+    frame = sys._getframe(2)
+    innermost = None
+    while frame is not None:
+        code = frame.f_code
+        if innermost is None and code.co_name not in CREATE_TASK:
+            innermost = frame
+        filename = code.co_filename
+        if filename != __file__ and not filename.startswith(ASYNCIO_DIR) \
+                and code.co_name not in CREATE_TASK \
+                and os.path.abspath(filename) not in skip:
+            break
+        if code.co_name == '_run_once' and (
+                innermost is None or os.path.abspath(
+                    innermost.f_code.co_filename) not in skip):
+            frame = innermost
+            break
+        frame = frame.f_back
+
+    if frame is None:
+        return '<unknown>'
+    return '%s:%d %s' % (os.path.basename(frame.f_code.co_filename),
+                         frame.f_lineno, frame.f_code.co_name)
+
+
+def await_stack(coroutine):
+    '''The names of the coroutines in the chain of `await`s, outermost
+    first'''
+    names = []
+    while coroutine is not None:
+        code = getattr(coroutine, 'cr_code', None) \
+            or getattr(coroutine, 'gi_code', None)
+        if code is None:
+            break
+        names.append(getattr(code, 'co_qualname', code.co_name))
+        coroutine = getattr(coroutine, 'cr_await', None) \
+            or getattr(coroutine, 'gi_yieldfrom', None)
+    return names
+
+
+class TaskStats:
+
+    def __init__(self, name, site):
+        self.name = name
+        self.site = site
+        self.tasks = 1
+        self.steps = 0
+        self.running = 0.0
+        self.scheduled = 0.0
+        self.waiting = 0.0
+        # Timestamps of the end of the last step and of the wakeup
+        self.stepped = None
+        self.ready = time.perf_counter()
+
+    def woken(self, future):
+        if self.ready is None:
+            self.ready = time.perf_counter()
+
+    def add(self, other):
+        self.tasks += other.tasks
+        self.steps += other.steps
+        self.running += other.running
+        self.scheduled += other.scheduled
+        self.waiting += other.waiting
+
+
+class ProfiledCoroutine:
+    '''Wraps a coroutine and times every `send` and `throw` the task
+    does, everything else is passed on to the coroutine'''
+
+    def __init__(self, coroutine, stats, profiler):
+        self.coroutine = coroutine
+        self.stats = stats
+        self.profiler = profiler
+
+    def send(self, value):
+        return self.step(self.coroutine.send, value)
+
+    def throw(self, *args):
+        return self.step(self.coroutine.throw, *args)
+
+    def close(self):
+        return self.coroutine.close()
+
+    def __await__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def __getattr__(self, name):
+        return getattr(self.coroutine, name)
+
+    def step(self, method, *args):
+        stats = self.stats
+        resumed = await_stack(self.coroutine)
+        start = time.perf_counter()
+        if stats.ready is None:
+            # Woken up without a future, by a cancellation for example
+            stats.ready = start
+        if stats.stepped is not None:
+            stats.waiting += stats.ready - stats.stepped
+        stats.scheduled += start - stats.ready
+        stats.ready = None
+        result = None
+        try:
+            result = method(*args)
+            return result
+        finally:
+            stats.stepped = time.perf_counter()
+            duration = stats.stepped - start
+            stats.steps += 1
+            stats.running += duration
+            if result is None:
+                # A bare yield, the task is scheduled again right away
+                stats.ready = stats.stepped
+            elif hasattr(result, 'add_done_callback'):
+                result.add_done_callback(stats.woken)
+            # Where the step ended up is closer to the slow code than
+            # where it started, unless the coroutine finished
+            self.profiler.record(
+                stats, await_stack(self.coroutine) or resumed, duration)
+
+
+class TaskProfiler:
+
+    def __init__(self, slow_callback=0.1, history=1000, skip=()):
+        '''`skip` are the modules (or objects defined in them, or file
+        names) of helpers that create tasks for their caller, like
+        `runner.Runner`, which aren't reported as creation site'''
+        self.slow_callback = slow_callback
+        self.skip = frozenset(
+            os.path.abspath(item if isinstance(item, str)
+                            else inspect.getfile(item))
+            for item in skip)
+        self.loop = None
+        self.previous_factory = None
+        # The stats of the running tasks, once done they're added to the
+        # totals per coroutine and creation site
+        self.tasks = dict()
+        self.totals = dict()
+        self.stacks = collections.Counter()
+        self.slow_steps = collections.deque(maxlen=history)
+
+    def install(self, loop):
+        self.loop = loop
+        self.previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self.task_factory)
+
+    def uninstall(self):
+        self.loop.set_task_factory(self.previous_factory)
+        self.loop = None
+
+    def task_factory(self, loop, coroutine, **kwargs):
+        stack = await_stack(coroutine)
+        stats = TaskStats(stack[0] if stack else repr(coroutine),
+                          creation_site(self.skip))
+        wrapped = ProfiledCoroutine(coroutine, stats, self)
+        if self.previous_factory is None:
+            task = asyncio.Task(wrapped, loop=loop, **kwargs)
+        else:
+            task = self.previous_factory(loop, wrapped, **kwargs)
+        self.tasks[task] = stats
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        stats = self.tasks.pop(task)
+        key = stats.name, stats.site
+        if key in self.totals:
+            self.totals[key].add(stats)
+        else:
+            self.totals[key] = stats
+
+    def record(self, stats, stack, duration):
+        self.stacks[';'.join(stack)] += duration
+        if duration >= self.slow_callback:
+            self.slow_steps.append((stats.name, stack, duration))
+            logger.warning('Task %s (created at %s) blocked the loop for '
+                           '%.3f seconds in %s', stats.name, stats.site,
+                           duration, ' -> '.join(stack))
+
+    def summary(self):
+        '''The totals per coroutine and creation site, including the
+        tasks that are still running'''
+        totals = dict()
+        for stats in list(self.totals.values()) + list(self.tasks.values()):
+            key = stats.name, stats.site
+            if key not in totals:
+                totals[key] = TaskStats(*key)
+                totals[key].tasks = 0
+            totals[key].add(stats)
+        return sorted(totals.values(), key=lambda stats: -stats.running)
+
+    def report(self, limit=20, file=None):
+        print('%-30s %-36s %6s %8s %10s %10s %10s' % (
+            'coroutine', 'created at', 'tasks', 'steps', 'running',
+            'scheduled', 'waiting'), file=file)
+        for stats in self.summary()[:limit]:
+            print('%-30s %-36s %6d %8d %9.3fs %9.3fs %9.3fs' % (
+                stats.name[-30:], stats.site[-36:], stats.tasks,
+                stats.steps, stats.running, stats.scheduled,
+                stats.waiting), file=file)
+        if self.slow_steps:
+            print('%d slow steps, the slowest took %.3f seconds' % (
+                len(self.slow_steps),
+                max(duration for name, stack, duration in self.slow_steps)),
+                file=file)
+
+    def dump(self, filename):
+        '''Write the running time per await stack in microseconds in the
+        collapsed stack format'''
+        with open(filename, 'w') as fh:
+            for stack, duration in sorted(self.stacks.items()):
+                fh.write('%s %d\n' % (stack, duration * 1e6))
@@ -1,3 +1,18 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+import importlib.util
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = '127.0.0.1'
+PORT = 1234
+
+
 def test_echo_server(xprocess):
     def prepare_server(cwd):
         return '', ['python3', '08_echo_server.py', 'server']
@@ -13,3 +28,125 @@ def test_echo_server(xprocess):
 
     xprocess.getinfo('echo_server').kill()
 
+
+def test_echo_server_workers(xprocess):
+    def prepare_server(cwd):
+        return '', ['python3', '08_echo_server.py', 'server',
+                    '--workers', 2]
+
+    def prepare_client(cwd):
+        return '', ['python3', '08_echo_server.py', 'client', 3]
+
+    server_pid, server_log_file = xprocess.ensure(
+        'echo_server_workers', prepare_server)
+
+    client_pid, client_log_file = xprocess.ensure(
+        'echo_client_workers', prepare_client)
+
+    xprocess.getinfo('echo_server_workers').kill()
+
+
+@pytest.fixture
+def echo_server(request):
+    '''Start `08_echo_server.py server` with the options of the test and
+    wait until it accepts connections'''
+    process = subprocess.Popen(
+        [sys.executable, '08_echo_server.py', 'server', '--duration', '30',
+         '--grace', '0', *request.param], cwd=HERE,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            request_lines(0)
+            break
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise
+            time.sleep(0.1)
+
+    yield process
+    process.terminate()
+    process.wait(10)
+
+
+def request_lines(repetitions, size=0):
+    with socket.create_connection((HOST, PORT), timeout=10) as connection:
+        stream = connection.makefile('rb')
+        start_time = float(stream.readline())
+        connection.sendall(b'%d %d\n' % (repetitions, size))
+        return start_time, stream.read().splitlines()
+
+
+@pytest.mark.parametrize('echo_server', [
+    [],
+    ['--workers', '2'],
+    ['--batch'],
+], indirect=True, ids=['single', 'reuse_port', 'batch'])
+def test_echo_round_trip(echo_server):
+    start_time, lines = request_lines(5)
+    assert start_time > 0
+    assert len(lines) == 5
+    for i, line in enumerate(lines):
+        assert line.startswith(b'client: (')
+        assert line.endswith(b', %d' % i)
+
+    _, lines = request_lines(3, size=100)
+    assert [len(line) for line in lines] == [99] * 3
+
+
+def load_echo_server():
+    spec = importlib.util.spec_from_file_location(
+        'echo_server', os.path.join(HERE, '08_echo_server.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_send_batched():
+    echo_server = load_echo_server()
+    messages = [echo_server.make_message(('127.0.0.1', 1), i, 100)
+                for i in range(1000)]
+
+    async def main():
+        received = bytearray()
+        done = asyncio.Event()
+
+        async def receive(reader, writer):
+            received.extend(await reader.read())
+            writer.close()
+            done.set()
+
+        server = await asyncio.start_server(receive, HOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection(HOST, port)
+            # A small high-water mark so the buffer is flushed many times
+            writer.transport.set_write_buffer_limits(high=4096)
+            await echo_server.send_batched(writer, iter(messages))
+            writer.close()
+            await done.wait()
+        return bytes(received)
+
+    assert asyncio.run(main()) == b''.join(messages)
+
+
+def test_percentiles():
+    echo_server = load_echo_server()
+    # 1 to 100 milliseconds, shuffled
+    values = [(i * 37 % 100 + 1) / 1000 for i in range(100)]
+    assert echo_server.percentiles(values, 50, 99, 99.9, 100) == dict(
+        p50=50.0, p99=99.0, p999=100.0, p100=100.0)
+    assert echo_server.percentiles([0.005], 50, 99) == dict(
+        p50=5.0, p99=5.0)
+    assert echo_server.percentiles([], 50) == dict(p50=None)
+
+
+@pytest.mark.parametrize('echo_server', [[]], indirect=True)
+def test_bench(echo_server):
+    report = asyncio.run(load_echo_server().bench(
+        clients=5, repetitions=3, size=64, pacing=0))
+    assert report['errors'] == 0
+    assert report['clients'] == 5
+    assert report['line_latency_ms']['p50'] is not None
+    assert report['lines_per_second'] > 0
@@ -0,0 +1,91 @@
+import os
+import asyncio
+
+import pytest
+
+from stream_reader import LineReader, FanOut
+
+
+def test_line_reader():
+    async def main():
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'one\n' + b'x' * 10 + b'\ntwo')
+        os.close(write_fd)
+        reader = LineReader(read_fd, buffer_size=8)
+        lines = [bytes(line) async for line in reader]
+        reader.close()
+        return lines
+
+    assert asyncio.run(main()) == [
+        b'one\n', b'xxxxxxxx', b'xx\n', b'two']
+
+
+async def numbers(count, error=None):
+    for i in range(count):
+        await asyncio.sleep(0)
+        yield i
+    if error is not None:
+        raise error
+
+
+def test_fan_out():
+    async def main():
+        fan_out = FanOut(numbers(50), maxsize=2)
+        consumers = [fan_out.subscribe() for _ in range(3)]
+
+        async def collect(consumer):
+            return [line async for line in consumer]
+
+        results = await asyncio.gather(
+            fan_out.run(), *(collect(consumer) for consumer in consumers))
+        return results[1:]
+
+    assert asyncio.run(main()) == [list(range(50))] * 3
+
+
+def test_fan_out_error_with_stalled_consumer():
+    async def main():
+        fan_out = FanOut(numbers(5, ValueError()), maxsize=10)
+        stalled = fan_out.subscribe()
+        with pytest.raises(ValueError):
+            # The stalled consumer's queue is full when the reader fails
+            await asyncio.wait_for(fan_out.run(), 1)
+        assert [line async for line in stalled] == []
+
+    asyncio.run(main())
+
+
+def test_fan_out_cancelled_with_stalled_consumer():
+    async def main():
+        fan_out = FanOut(numbers(100), maxsize=1)
+        stalled = fan_out.subscribe()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(fan_out.run(), 0.05)
+        assert [line async for line in stalled] == []
+
+    asyncio.run(main())
+
+
+def test_fan_out_consumer_stops_early():
+    async def main():
+        fan_out = FanOut(numbers(100), maxsize=1)
+        early = fan_out.subscribe()
+        other = fan_out.subscribe()
+
+        async def take(consumer, count):
+            lines = []
+            async for line in consumer:
+                lines.append(line)
+                if len(lines) == count:
+                    break
+            await consumer.aclose()
+            return lines
+
+        async def collect(consumer):
+            return [line async for line in consumer]
+
+        results = await asyncio.wait_for(asyncio.gather(
+            fan_out.run(), take(early, 3), collect(other)), 1)
+        return results[1:]
+
+    assert asyncio.run(main()) == [[0, 1, 2], list(range(100))]
@@ -0,0 +1,86 @@
+import heapq
+import random
+import asyncio
+import itertools
+
+from timer_wheel import TimerWheel
+
+
+def test_cancel_timer_in_same_tick():
+    async def main():
+        loop = asyncio.get_running_loop()
+        wheel = TimerWheel(loop)
+        fired = []
+
+        def cancel_other():
+            fired.append('first')
+            second.cancel()
+
+        when = loop.time() + 0.01
+        wheel.call_at(when, cancel_other)
+        second = wheel.call_at(when, fired.append, 'second')
+        await asyncio.sleep(0.05)
+        assert fired == ['first']
+        assert len(wheel) == 0
+
+        wheel.call_later(0.01, fired.append, 'later')
+        await asyncio.sleep(0.05)
+        assert fired == ['first', 'later']
+        wheel.close()
+
+    asyncio.run(main())
+
+
+class FakeHandle:
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    '''Runs the scheduled callbacks exactly on time'''
+
+    def __init__(self):
+        self.now = 0.0
+        self.scheduled = []
+        self.counter = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        handle = FakeHandle()
+        heapq.heappush(self.scheduled,
+                       (when, next(self.counter), handle, callback))
+        return handle
+
+    def call_exception_handler(self, context):
+        raise context['exception']
+
+    def run(self):
+        while self.scheduled:
+            when, _, handle, callback = heapq.heappop(self.scheduled)
+            if not handle.cancelled:
+                self.now = max(self.now, when)
+                callback()
+
+
+def test_lateness_bound():
+    loop = FakeLoop()
+    # Small wheels so timers cascade through every level and park
+    resolution = 0.001
+    wheel = TimerWheel(loop, resolution=resolution, bits=4, levels=3)
+    random.seed(1)
+    lateness = []
+    for _ in range(20000):
+        when = random.random() * 10
+        wheel.call_at(
+            when, lambda when=when: lateness.append(loop.now - when))
+    loop.run()
+
+    assert len(lateness) == 20000
+    assert min(lateness) >= 0
+    assert max(lateness) <= resolution * (1 + 1e-6)
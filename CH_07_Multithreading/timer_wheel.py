@@ -0,0 +1,276 @@
+'''
+A hierarchical timer wheel for very large numbers of timers.
+
+asyncio keeps the `call_at`/`call_later` timers in a heap, so every timer
+costs O(log n) to add and cancelled timers stay in the heap until they
+are cleaned up. A server with a timeout per connection mostly cancels
+its timers, which is the case a timer wheel is good at: adding and
+cancelling a timer is O(1). This wheel is pure Python while the heap
+operations are in C, so adding a few thousand timers is about as fast
+as with the heap. The wheel wins on cancelling (about twice as fast)
+and once there are 100,000 or more timers pending.
+
+The time is divided into ticks of `resolution` seconds. The first wheel
+has a slot per tick for the next `slots` ticks, the next wheel a slot per
+`slots` ticks and so on. Every time the first wheel goes round, the next
+slot of the second wheel is cascaded into the first one (and so on for
+the other wheels). Timers fire at most one tick late (the time is
+rounded up to a whole tick) and never early, apart from the latency of
+the loop itself.
+
+    wheel = TimerWheel(loop)
+    timer = wheel.call_later(30, writer.close)
+    ...
+    timer.cancel()
+
+The wheel needs a single asyncio timer of its own, for the next tick
+that has any timers. Run this file for a benchmark against asyncio's
+heap, the sizes can be passed as arguments.
+'''
+import sys
+import math
+import time
+import random
+import asyncio
+
+
+class Timer:
+    __slots__ = ('wheel', 'tick', 'when_', 'callback', 'args', 'slot',
+                 'level')
+
+    def __init__(self, wheel, when, callback, args):
+        self.wheel = wheel
+        self.when_ = when
+        # Rounded up so the timer never fires early
+        self.tick = math.ceil(when / wheel.resolution)
+        self.callback = callback
+        self.args = args
+        self.slot = None
+        self.level = None
+
+    def when(self):
+        return self.when_
+
+    def cancelled(self):
+        return self.callback is None
+
+    def cancel(self):
+        if self.slot is not None:
+            del self.slot[self]
+            self.wheel.counts[self.level] -= 1
+            self.slot = None
+        self.callback = self.args = None
+
+    def __repr__(self):
+        return '<Timer when=%.3f %s>' % (
+            self.when_, 'cancelled' if self.cancelled() else self.callback)
+
+
+class TimerWheel:
+
+    def __init__(self, loop=None, resolution=0.001, bits=8, levels=4):
+        self.loop = loop or asyncio.get_event_loop()
+        self.resolution = resolution
+        self.bits = bits
+        self.slots = 1 << bits
+        self.mask = self.slots - 1
+        self.levels = levels
+        # The slots are dicts (without values) so a timer is removed from
+        # its slot in O(1)
+        self.wheels = [[dict() for _ in range(self.slots)]
+                       for _ in range(levels)]
+        self.counts = [0] * levels
+        self.current = self.time_tick()
+        self.handle = None
+        self.handle_tick = None
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def time_tick(self):
+        return int(self.loop.time() / self.resolution)
+
+    def call_at(self, when, callback, *args):
+        if self.handle is None:
+            # Idle, no need to go through the ticks that passed since
+            self.current = max(self.current, self.time_tick())
+        timer = Timer(self, when, callback, args)
+        self.insert(timer)
+        if self.handle_tick is None or timer.tick < self.handle_tick:
+            self.schedule(timer.tick)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.loop.time() + delay, callback, *args)
+
+    def insert(self, timer, earliest=None):
+        # Timers that are due are put in the next slot to be expired,
+        # while cascading that's the current slot
+        if earliest is None:
+            earliest = self.current + 1
+        tick = max(timer.tick, earliest)
+        delta = tick - self.current
+        level = 0
+        while delta >= 1 << (self.bits * (level + 1)):
+            level += 1
+            if level == self.levels - 1:
+                # Too far in the future, park it in the last slot of the
+                # last wheel and place it again when that slot cascades
+                max_delta = (1 << (self.bits * self.levels)) - 1
+                tick = min(tick, self.current + max_delta)
+                break
+
+        slot = self.wheels[level][(tick >> (self.bits * level)) & self.mask]
+        slot[timer] = None
+        timer.slot = slot
+        timer.level = level
+        self.counts[level] += 1
+
+    def cascade(self, tick):
+        '''Move the timers of the higher wheels down, called when the
+        first wheel went round'''
+        for level in range(1, self.levels):
+            index = (tick >> (self.bits * level)) & self.mask
+            slot = self.wheels[level][index]
+            if slot:
+                self.wheels[level][index] = dict()
+                self.counts[level] -= len(slot)
+                for timer in slot:
+                    self.insert(timer, tick)
+            if index:
+                break
+
+    def advance(self, tick):
+        '''Run all timers up to and including `tick`'''
+        while self.current < tick:
+            if not self.counts[0]:
+                # Nothing in the first wheel, skip to the next cascade
+                last = self.current | self.mask
+                if last >= tick:
+                    self.current = tick
+                    break
+                self.current = last
+
+            self.current += 1
+            index = self.current & self.mask
+            if not index:
+                self.cascade(self.current)
+
+            slot = self.wheels[0][index]
+            if slot:
+                self.wheels[0][index] = dict()
+                self.counts[0] -= len(slot)
+                # Detach all of them first, a callback can cancel another
+                # timer of this slot
+                for timer in slot:
+                    timer.slot = None
+                for timer in slot:
+                    if timer.callback is None:
+                        continue
+                    if timer.tick > self.current:
+                        # Parked at the end of the wheel
+                        self.insert(timer)
+                    else:
+                        self.run(timer)
+
+    def run(self, timer):
+        callback, args = timer.callback, timer.args
+        timer.callback = timer.args = None
+        try:
+            callback(*args)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except BaseException as exception:
+            self.loop.call_exception_handler(dict(
+                message='Exception in timer wheel callback %r' % callback,
+                exception=exception,
+            ))
+
+    def next_tick(self):
+        '''The next tick that has to be processed: the first non-empty
+        slot of the first wheel or else the next cascade'''
+        if not len(self):
+            return None
+        if self.counts[0]:
+            for tick in range(self.current + 1,
+                              (self.current | self.mask) + 1):
+                if self.wheels[0][tick & self.mask]:
+                    return tick
+        return (self.current | self.mask) + 1
+
+    def schedule(self, tick):
+        if self.handle is not None:
+            self.handle.cancel()
+        self.handle_tick = tick
+        self.handle = self.loop.call_at(
+            tick * self.resolution, self.on_tick)
+
+    def on_tick(self):
+        # The loop runs timers that are due within its clock resolution,
+        # so the clock can be a little behind the scheduled tick
+        tick = max(self.time_tick(), self.handle_tick)
+        self.handle = self.handle_tick = None
+        self.advance(tick)
+        tick = self.next_tick()
+        if tick is not None and (
+                self.handle_tick is None or tick < self.handle_tick):
+            self.schedule(tick)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.cancel()
+        self.handle = self.handle_tick = None
+
+
+# -----------------------------------------------------------------------------
+def measure(loop, scheduler, size, cancel):
+    '''Time adding `size` timers in the next 60 seconds and cancelling
+    them, and adding `size` timers in the next 0.5 seconds and running
+    them'''
+    random.seed(size)
+    delays = [random.random() * 60 for _ in range(size)]
+    call_later = scheduler.call_later
+    callback = cancel.append
+
+    start = time.perf_counter()
+    timers = [call_later(delay, callback, None) for delay in delays]
+    added = time.perf_counter()
+    for timer in timers:
+        timer.cancel()
+    # asyncio cleans up the heap once most of it is cancelled
+    loop.run_until_complete(asyncio.sleep(0))
+    cancelled = time.perf_counter()
+
+    del timers[:]
+    done = loop.create_future()
+
+    def last():
+        if len(cancel) == size:
+            done.set_result(None)
+
+    start_run = time.perf_counter()
+    for delay in delays:
+        call_later(delay / 120, callback, None)
+    scheduler.call_later(0.51, last)
+    loop.run_until_complete(done)
+    fired = time.perf_counter() - start_run
+    del cancel[:]
+    return added - start, cancelled - added, fired
+
+
+def benchmark(sizes=(10000, 100000, 1000000)):
+    print('%-6s %9s %10s %10s %14s' % (
+        'type', 'timers', 'add', 'cancel', 'add and run'))
+    for size in sizes:
+        for name in ('heap', 'wheel'):
+            loop = asyncio.new_event_loop()
+            scheduler = loop if name == 'heap' else TimerWheel(loop)
+            results = measure(loop, scheduler, size, [])
+            print('%-6s %9d %9.3fs %9.3fs %13.3fs' % (
+                (name, size) + results))
+            loop.close()
+
+
+if __name__ == '__main__':
+    benchmark([int(size) for size in sys.argv[1:]] or
+              (10000, 100000, 1000000))
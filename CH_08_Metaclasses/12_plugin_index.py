@@ -0,0 +1,10 @@
+import plugins
+
+# The index is stored in a file so only the first run (or a run after
+# a plugin changed) has to parse the plugin modules, nothing is imported
+# until a plugin is requested
+plugins.PluginsThroughFilesystemSearch.load_index(
+    '.plugin_index.json', plugins='plugins')
+
+print(plugins.PluginsThroughFilesystemSearch.locations)
+print(plugins.PluginsThroughFilesystemSearch.get('spam'))
@@ -0,0 +1,19 @@
+import sys
+import plugins
+
+# Only registers proxies, none of the plugin modules is imported yet
+plugins.PluginsThroughConfiguration.load(
+    'plugins.spam:spam',
+    'plugins.eggs',
+    lazy=True,
+)
+
+spam = plugins.PluginsThroughConfiguration.get('spam')
+print(spam)
+print('plugins.spam' in sys.modules)
+
+# The first attribute access imports the module
+print(spam.name)
+print('plugins.spam' in sys.modules)
+print('plugins.eggs' in sys.modules)
+print(plugins.PluginsThroughConfiguration.get('spam'))
@@ -0,0 +1,8 @@
+import plugins
+
+# Import the plugin modules from a thread pool and show which plugin
+# modules were the slowest to import
+plugins.PluginsThroughFilesystemSearch.load(
+    parallel=True, plugins='plugins')
+
+plugins.PluginsThroughFilesystemSearch.print_import_report()
@@ -1,9 +1,12 @@
+from .base import LazyPlugin
 from .base import Plugin
 from .base import Plugins
 from .base import PluginsOnDemand
 from .base import PluginsThroughConfiguration
 from .base import PluginsThroughFilesystemSearch
+from .index import PluginIndex
 
-__all__ = ['Plugin', 'Plugins', 'PluginsOnDemand',
-           'PluginsThroughConfiguration', 'PluginsThroughFilesystemSearch']
+__all__ = ['LazyPlugin', 'Plugin', 'Plugins', 'PluginsOnDemand',
+           'PluginsThroughConfiguration', 'PluginsThroughFilesystemSearch',
+           'PluginIndex']
 
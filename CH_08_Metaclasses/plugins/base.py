@@ -1,7 +1,13 @@
 import os
 import re
 import abc
+import sys
+import time
 import importlib
+import importlib.util
+from concurrent import futures
+
+from . import index
 
 
 MODULE_NAME_RE = re.compile('[a-z][a-z0-9_]*', re.IGNORECASE)
@@ -11,6 +17,9 @@ class Plugins(abc.ABCMeta):
 
     plugins = dict()
 
+    # Seconds it took to import every plugin module, in import order
+    import_times = dict()
+
     def __new__(metaclass, name, bases, namespace):
         cls = abc.ABCMeta.__new__(
             metaclass, name, bases, namespace)
@@ -22,6 +31,62 @@ class Plugins(abc.ABCMeta):
     def get(cls, name):
         return cls.plugins[name]
 
+    @classmethod
+    def import_module(cls, import_path):
+        '''Import a plugin module and record how long the import took,
+        modules that were already imported keep their first time (or
+        aren't recorded at all when imported some other way)'''
+        if import_path in sys.modules:
+            return sys.modules[import_path]
+        start = time.perf_counter()
+        module = importlib.import_module(import_path)
+        # With parallel imports another thread may have been first
+        Plugins.import_times.setdefault(
+            import_path, time.perf_counter() - start)
+        return module
+
+    @classmethod
+    def import_modules(cls, import_paths, parallel=False, max_workers=None):
+        '''Import the modules in order or, with `parallel`, from a thread
+        pool. Threads only help for modules that wait on I/O during the
+        import (network, disk, subprocesses), pure Python imports are
+        serialized by the GIL.'''
+        if parallel:
+            with futures.ThreadPoolExecutor(max_workers) as executor:
+                # list() to raise the first import error
+                list(executor.map(cls.import_module, import_paths))
+        else:
+            for import_path in import_paths:
+                cls.import_module(import_path)
+
+    @classmethod
+    def import_report(cls):
+        '''The import time per plugin module, slowest first. Like
+        `python -X importtime` but limited to the plugin modules and with
+        the plugins each module registered. With parallel imports the
+        times include waiting for the import lock of shared modules.'''
+        names = dict()
+        for name, plugin in cls.plugins.items():
+            names.setdefault(plugin.__module__, []).append(name)
+
+        report = []
+        for import_path, seconds in Plugins.import_times.items():
+            report.append(dict(
+                module=import_path,
+                microseconds=int(seconds * 1e6),
+                plugins=sorted(names.get(import_path, [])),
+            ))
+        report.sort(key=lambda row: row['microseconds'], reverse=True)
+        return report
+
+    @classmethod
+    def print_import_report(cls):
+        print('plugin import time [us] | module | plugins')
+        for row in cls.import_report():
+            print('%23d | %s | %s' % (
+                row['microseconds'], row['module'],
+                ', '.join(row['plugins'])))
+
 
 class Plugin(metaclass=Plugins):
 
@@ -41,16 +106,83 @@ class PluginsOnDemand(Plugins):
         return cls.plugins[name]
 
 
+class LazyPlugin:
+    '''Stands in for a plugin class until it's used, the first attribute
+    access or call imports the module that defines the plugin'''
+
+    __slots__ = ('plugin_name', 'plugin_module', 'plugin')
+
+    def __init__(self, name, module):
+        self.plugin_name = name
+        self.plugin_module = module
+        self.plugin = None
+
+    def resolve(self):
+        if self.plugin is None:
+            Plugins.import_module(self.plugin_module)
+            self.plugin = Plugins.plugins[self.plugin_name]
+        return self.plugin
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        if self.plugin is None:
+            return '<LazyPlugin %r from %s>' % (
+                self.plugin_name, self.plugin_module)
+        return repr(self.plugin)
+
+
 class PluginsThroughConfiguration(Plugins):
 
+    # Plugin name to LazyPlugin for the plugins loaded with lazy=True
+    lazy_plugins = dict()
+
     @classmethod
-    def load(cls, *plugin_modules):
-        for plugin_module in plugin_modules:
-            importlib.import_module(plugin_module)
+    def get(cls, name):
+        if name in cls.plugins:
+            return cls.plugins[name]
+        return cls.lazy_plugins[name]
+
+    @classmethod
+    def load(cls, *plugin_modules, lazy=False, parallel=False,
+             max_workers=None):
+        '''Import the plugin modules, with `lazy` the plugins are
+        registered as `LazyPlugin` proxies instead and the modules are
+        only imported once a plugin is used. A lazy declaration can name
+        the plugin explicitly (`plugins.spam:spam`), otherwise the names
+        are found by parsing the module source.'''
+        if lazy:
+            for plugin_module in plugin_modules:
+                cls.load_lazy(plugin_module)
+        else:
+            cls.import_modules(plugin_modules, parallel, max_workers)
+
+    @classmethod
+    def load_lazy(cls, declaration):
+        plugin_module, _, name = declaration.partition(':')
+        if name:
+            names = [name]
+        else:
+            spec = importlib.util.find_spec(plugin_module)
+            if spec is None or not spec.origin:
+                raise ImportError('No module named %r' % plugin_module)
+            with open(spec.origin, 'rb') as fh:
+                names = index.find_plugin_names(fh.read())
+
+        for name in names:
+            cls.lazy_plugins[name] = LazyPlugin(name, plugin_module)
 
 
 class PluginsThroughFilesystemSearch(Plugins):
 
+    # Plugin name to import path for the plugins found through an index
+    # that haven't been imported yet
+    locations = dict()
+
     def __new__(metaclass, name, bases, namespace):
         cls = abc.ABCMeta.__new__(
             metaclass, name, bases, namespace)
@@ -60,15 +192,24 @@ class PluginsThroughFilesystemSearch(Plugins):
 
     @classmethod
     def get(cls, name):
+        if name not in cls.plugins and name in cls.locations:
+            cls.import_module(cls.locations[name])
         return cls.plugins[name]
 
     @classmethod
-    def load_directory(cls, module, directory):
+    def load_directory(cls, module, directory, parallel=False,
+                       max_workers=None):
+        import_paths = []
         for file_ in os.listdir(directory):
             name, ext = os.path.splitext(file_)
             full_path = os.path.join(directory, file_)
             import_path = [module]
             if os.path.isdir(full_path):
+                # Only packages, not `__pycache__` and other directories
+                init = os.path.join(full_path, '__init__.py')
+                if not MODULE_NAME_RE.match(file_) \
+                        or not os.path.isfile(init):
+                    continue
                 import_path.append(file_)
             elif ext == '.py' and MODULE_NAME_RE.match(name):
                 import_path.append(name)
@@ -76,9 +217,21 @@ class PluginsThroughFilesystemSearch(Plugins):
                 # Ignoring non-matching files/directories
                 continue
 
-            importlib.import_module('.'.join(import_path))
+            import_paths.append('.'.join(import_path))
+
+        cls.import_modules(import_paths, parallel, max_workers)
+
+    @classmethod
+    def load(cls, parallel=False, max_workers=None, **plugin_directories):
+        for module, directory in plugin_directories.items():
+            cls.load_directory(module, directory, parallel, max_workers)
 
     @classmethod
-    def load(cls, **plugin_directories):
+    def load_index(cls, index_filename, **plugin_directories):
+        '''Like `load` but the plugins are looked up in a persistent
+        index and only imported by `get`'''
+        plugin_index = index.PluginIndex(index_filename)
         for module, directory in plugin_directories.items():
-            cls.load_directory(module, directory)
+            cls.locations.update(plugin_index.update_directory(
+                module, directory, MODULE_NAME_RE))
+        plugin_index.save()
@@ -0,0 +1,145 @@
+'''
+A persistent index of the plugins in a directory.
+
+`PluginsThroughFilesystemSearch.load_directory` imports every module it
+finds at startup. The index instead maps the plugin names to the module
+they are defined in by parsing the source, and stores that mapping in a
+JSON file. On the next start only the files that changed (different
+mtime/size and content hash) are parsed again and no plugin is imported
+until it's requested.
+'''
+import os
+import ast
+import json
+import hashlib
+
+
+VERSION = 1
+
+
+def find_plugin_names(source):
+    '''Return the string `name` attributes of the classes in the source
+    without importing it'''
+    names = []
+    for node in ast.walk(ast.parse(source)):
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        for statement in node.body:
+            if not isinstance(statement, ast.Assign):
+                continue
+            if not isinstance(statement.value, ast.Constant):
+                continue
+            if not isinstance(statement.value.value, str):
+                continue
+            for target in statement.targets:
+                if isinstance(target, ast.Name) and target.id == 'name':
+                    names.append(statement.value.value)
+    return names
+
+
+class PluginIndex:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.directories = dict()
+        self.files = dict()
+        self.changed = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+
+        if data.get('version') == VERSION:
+            self.directories = data['directories']
+            self.files = data['files']
+
+    def save(self):
+        if not self.changed:
+            return
+
+        # Write to a temporary file first so a crash never leaves a
+        # half written index behind
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as fh:
+            json.dump(dict(
+                version=VERSION,
+                directories=self.directories,
+                files=self.files,
+            ), fh, indent=4, sort_keys=True)
+        os.replace(tmp_filename, self.filename)
+        self.changed = False
+
+    def update_file(self, path, import_path):
+        '''Return the plugin names in `path`, the file is only hashed
+        when its mtime or size changed and only parsed when its content
+        did'''
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns \
+                and entry['size'] == stat.st_size \
+                and entry['import_path'] == import_path:
+            return entry['names']
+
+        with open(path, 'rb') as fh:
+            source = fh.read()
+        digest = hashlib.sha1(source).hexdigest()
+
+        if entry and entry['sha1'] == digest \
+                and entry['import_path'] == import_path:
+            names = entry['names']
+        else:
+            names = find_plugin_names(source)
+
+        self.files[path] = dict(
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            sha1=digest,
+            import_path=import_path,
+            names=names,
+        )
+        self.changed = True
+        return names
+
+    def update_directory(self, module, directory, module_name_re):
+        '''Index the modules and packages in `directory` and return a
+        dict mapping the plugin names to their import paths'''
+        directory = os.path.abspath(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        entry = self.directories.get(directory)
+
+        if entry and entry['mtime_ns'] == mtime_ns \
+                and entry['module'] == module:
+            # No files were added or removed so the listing is unchanged
+            paths = entry['paths']
+        else:
+            paths = []
+            for file_ in sorted(os.listdir(directory)):
+                name, ext = os.path.splitext(file_)
+                full_path = os.path.join(directory, file_)
+                if os.path.isdir(full_path):
+                    init = os.path.join(full_path, '__init__.py')
+                    if module_name_re.match(file_) and os.path.isfile(init):
+                        paths.append([init, '%s.%s' % (module, file_)])
+                elif ext == '.py' and module_name_re.match(name):
+                    paths.append([full_path, '%s.%s' % (module, name)])
+
+            # Drop the entries of removed files
+            known = set(path for path, import_path in paths)
+            for path in list(self.files):
+                if path.startswith(directory + os.sep) and path not in known:
+                    del self.files[path]
+
+            self.directories[directory] = dict(
+                mtime_ns=mtime_ns, module=module, paths=paths)
+            self.changed = True
+
+        plugins = dict()
+        for path, import_path in paths:
+            for name in self.update_file(path, import_path):
+                plugins[name] = import_path
+        return plugins
@@ -0,0 +1,52 @@
+'''
+The fibonacci implementations from CH_02_Pythonic/main.ipynb and the
+`memoize` decorator versus `functools.lru_cache` from
+CH_05_Decorators/main.ipynb. The caches are created fresh for every call
+so the recursion is measured and not only the cache lookup.
+'''
+import functools
+
+
+SIZES = (20, 100, 300)
+
+
+def fib(n):
+    return functools.reduce(
+        lambda x, y: (x[0] + x[1], x[0]), [(1, 1)] * (n - 2))[0]
+
+
+def fib2(n):
+    a, b = 0, 1
+    for _ in range(n):
+        yield a
+        a, b = b, a + b
+
+
+def memoize(function):
+    function.cache = dict()
+
+    @functools.wraps(function)
+    def _memoize(*args):
+        if args not in function.cache:
+            function.cache[args] = function(*args)
+        return function.cache[args]
+    return _memoize
+
+
+def recursive_fibonacci(decorator):
+    @decorator
+    def fibonacci(n):
+        if n < 2:
+            return n
+        else:
+            return fibonacci(n - 1) + fibonacci(n - 2)
+    return fibonacci
+
+
+VARIANTS = dict(
+    reduce=lambda size: lambda: fib(size),
+    generator=lambda size: lambda: list(fib2(size)),
+    memoize=lambda size: lambda: recursive_fibonacci(memoize)(size),
+    lru_cache=lambda size: lambda: recursive_fibonacci(
+        functools.lru_cache(maxsize=None))(size),
+)
@@ -0,0 +1,18 @@
+'''The `filter_modulo` variants from CH_02_Pythonic/filter_modulo.py'''
+from CH_02_Pythonic import filter_modulo
+
+
+SIZES = (100, 10000, 1000000)
+
+
+def variant(function, convert):
+    def setup(size):
+        items = convert(range(size))
+        return lambda: filter_modulo.materialize(function(items, 3))
+    return setup
+
+
+VARIANTS = {
+    name: variant(function, convert)
+    for name, function, convert in filter_modulo.VARIANTS
+}
@@ -0,0 +1,42 @@
+'''
+The `process_sleeper` variants from CH_07_Multithreading/06_processes.py:
+waiting for every process before starting the next, starting them all
+and waiting afterwards, and the bounded `AsyncProcessPool`. The size is
+the number of processes, the command is `true` so the process overhead
+is measured instead of the sleep.
+'''
+import asyncio
+import subprocess
+
+from CH_07_Multithreading.process_pool import AsyncProcessPool
+
+
+SIZES = (10, 100)
+COMMAND = ('true',)
+
+
+def sequential(count):
+    for i in range(count):
+        subprocess.Popen(COMMAND).wait()
+
+
+def fire_and_wait(count):
+    processes = [subprocess.Popen(COMMAND) for i in range(count)]
+    for process in processes:
+        process.wait()
+
+
+def pooled(count, concurrency=16):
+    async def run():
+        pool = AsyncProcessPool(concurrency=concurrency)
+        async for result in pool.map([COMMAND] * count):
+            pass
+
+    asyncio.run(run())
+
+
+VARIANTS = dict(
+    sequential=lambda size: lambda: sequential(size),
+    fire_and_wait=lambda size: lambda: fire_and_wait(size),
+    pool=lambda size: lambda: pooled(size),
+)
@@ -0,0 +1,46 @@
+'''
+The `sleeper` tasks from CH_07_Multithreading/02_singlethread.py with a
+zero delay, so only the cost of scheduling the coroutines is measured.
+The size is the number of sleepers.
+'''
+import asyncio
+
+
+SIZES = (10, 1000, 10000)
+
+
+async def sleeper(delay):
+    await asyncio.sleep(delay)
+
+
+async def sequential(count):
+    for i in range(count):
+        await sleeper(0)
+
+
+async def gather(count):
+    await asyncio.gather(*(sleeper(0) for i in range(count)))
+
+
+async def wait(count):
+    await asyncio.wait([asyncio.create_task(sleeper(0))
+                        for i in range(count)])
+
+
+def variant(function):
+    def setup(size):
+        loop = asyncio.new_event_loop()
+
+        def run():
+            loop.run_until_complete(function(size))
+
+        run.close = loop.close
+        return run
+    return setup
+
+
+VARIANTS = dict(
+    sequential=variant(sequential),
+    gather=variant(gather),
+    wait=variant(wait),
+)
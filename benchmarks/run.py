@@ -0,0 +1,203 @@
+'''
+Time the different implementations of the chapter examples.
+
+Every `bench_*.py` module in this directory defines `SIZES` and
+`VARIANTS`, a dict mapping the variant names to a setup function. The
+setup function gets the input size and returns the function to time:
+
+    SIZES = (100, 10000)
+    VARIANTS = dict(
+        comprehension=lambda size: lambda: [i for i in range(size)],
+    )
+
+A setup function that allocates resources (an event loop for example)
+can give the returned function a `close` attribute, which is called
+after the measurement.
+
+For every variant and size the median time per call over `repeat`
+rounds, the spread of those rounds and the peak memory (measured with
+`tracemalloc` during a separate call) are stored in a JSON file. Given a
+baseline file the results are compared to it and the regressions are
+listed, in which case the exit status is 1. A slowdown only counts when
+it's larger than the threshold plus the spread of both runs, so a noisy
+benchmark needs a bigger difference:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline --filter filter_modulo
+'''
+import gc
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import statistics
+import platform
+import importlib
+import tracemalloc
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+
+def find_modules():
+    for path in sorted(glob.glob(os.path.join(BENCHMARKS_DIR, 'bench_*.py'))):
+        yield os.path.splitext(os.path.basename(path))[0]
+
+
+def measure(function, min_duration=0.2, repeat=7):
+    '''Return the median time per call in seconds, the spread of the
+    rounds relative to the median and the peak memory in bytes. The
+    number of calls per round is chosen so a round takes at least
+    `min_duration` seconds.'''
+    start = time.perf_counter()
+    function()
+    duration = time.perf_counter() - start
+    number = max(1, int(min_duration / max(duration, 1e-9)))
+
+    # Like timeit, without garbage collections that depend on what ran
+    # before
+    gc.collect()
+    gc.disable()
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            times.append((time.perf_counter() - start) / number)
+    finally:
+        gc.enable()
+    median = statistics.median(times)
+    # The interquartile range, a single slow round (a garbage
+    # collection, another process) doesn't make the whole run noisy
+    quartiles = statistics.quantiles(times, n=4) if repeat > 1 \
+        else [median] * 3
+    spread = (quartiles[2] - quartiles[0]) / median
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return median, spread, peak
+
+
+def run(pattern=None, min_duration=0.2, repeat=7, verbose=True):
+    '''Run the benchmarks with a `module/variant` name matching the
+    regular expression `pattern`'''
+    # The chapter directories are importable as namespace packages, for
+    # example `from CH_02_Pythonic import filter_modulo`
+    sys.path[:0] = [BENCHMARKS_DIR, ROOT_DIR]
+    results = dict()
+    for module_name in find_modules():
+        module = importlib.import_module(module_name)
+        for variant, setup in module.VARIANTS.items():
+            name = '%s/%s' % (module_name[len('bench_'):], variant)
+            if pattern and not re.search(pattern, name):
+                continue
+
+            results[name] = dict()
+            for size in module.SIZES:
+                function = setup(size)
+                try:
+                    seconds, spread, peak = measure(
+                        function, min_duration, repeat)
+                finally:
+                    close = getattr(function, 'close', None)
+                    if close is not None:
+                        close()
+                results[name][str(size)] = dict(
+                    seconds=seconds, spread=spread, peak_bytes=peak)
+                if verbose:
+                    print('%-40s %10d %12.6fs %6.1f%% %12d bytes' % (
+                        name, size, seconds, spread * 100, peak))
+    return dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        results=results,
+    )
+
+
+def compare(results, baseline, threshold=0.25, min_seconds=1e-6):
+    '''Return a list of `(name, size, metric, baseline, current)` for
+    everything that got more than `threshold` bigger, or slower by more
+    than `threshold` plus the spread of the baseline and current run'''
+    regressions = []
+    for name, sizes in results['results'].items():
+        for size, current in sizes.items():
+            previous = baseline['results'].get(name, dict()).get(size)
+            if previous is None:
+                continue
+
+            for metric in ('seconds', 'peak_bytes'):
+                limit = threshold
+                if metric == 'seconds':
+                    # Tiny differences are just noise
+                    if current[metric] - previous[metric] < min_seconds:
+                        continue
+                    limit += previous.get('spread', 0) \
+                        + current.get('spread', 0)
+                if current[metric] > previous[metric] * (1 + limit):
+                    regressions.append((
+                        name, size, metric, previous[metric],
+                        current[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--filter', help='regular expression to select the '
+                        'benchmarks by `module/variant` name')
+    parser.add_argument('--baseline', help='compare with this results file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown counted as a regression')
+    parser.add_argument('--min-duration', type=float, default=0.2,
+                        help='minimum seconds per round')
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='number of rounds, the median is used')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.min_duration, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = dict(results=dict())
+        if os.path.exists(BASELINE):
+            with open(BASELINE) as fh:
+                baseline = json.load(fh)
+        # Only replace the benchmarks that ran this time
+        baseline['results'].update(results['results'])
+        baseline.update(python=results['python'],
+                        platform=results['platform'])
+        with open(BASELINE, 'w') as fh:
+            json.dump(baseline, fh, indent=4, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.threshold)
+        for name, size, metric, previous, current in regressions:
+            print('REGRESSION %s (size %s) %s: %.6g -> %.6g (%+.0f%%)' % (
+                name, size, metric, previous, current,
+                (current / previous - 1) * 100 if previous else 0))
+        if regressions:
+            return 1
+        print('No regressions compared to %s' % args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())